@@ -0,0 +1,79 @@
+import os
+import json
+import shutil
+import hashlib
+import ds_format as ds
+
+# Version of the cache format. Changing it invalidates existing caches.
+VERSION = 1
+
+def key(filenames, options, dirnames=[]):
+	"""Get a cache key for input files filenames processed with options
+	(dict). The key is a hash of the options, the names and contents of the
+	files and the names, sizes and modification times of the files in
+	directories dirnames (such as coupled data, whose contents are too large
+	to hash)."""
+	h = hashlib.sha256()
+	h.update(json.dumps(
+		dict(options, version=VERSION),
+		sort_keys=True,
+		default=str,
+	).encode('utf-8'))
+	for filename in filenames:
+		h.update(os.path.basename(filename).encode('utf-8'))
+		if not os.path.isfile(filename):
+			continue
+		with open(filename, 'rb') as f:
+			for chunk in iter(lambda: f.read(1 << 20), b''):
+				h.update(chunk)
+	for dirname in dirnames:
+		for file_ in sorted(os.listdir(dirname)):
+			st = os.stat(os.path.join(dirname, file_))
+			h.update(('%s %d %d' % (file_, st.st_size, st.st_mtime_ns)) \
+				.encode('utf-8'))
+	return h.hexdigest()
+
+def index_file(cache, dirname):
+	"""Get the name of a file in the cache directory cache which stores an
+	index of files in directory dirname"""
+	h = hashlib.sha256(os.path.abspath(dirname).encode('utf-8')).hexdigest()
+	return os.path.join(cache, 'index-%s.json' % h)
+
+def complete(dirname):
+	"""Check if the cache in dirname is complete"""
+	return os.path.isdir(dirname)
+
+def read(dirname):
+	"""Read datasets stored in the cache in dirname"""
+	for file_ in sorted(os.listdir(dirname)):
+		filename = os.path.join(dirname, file_)
+		print('<- %s' % filename)
+		d = ds.read(filename)
+		d['.'] = {
+			var: {
+				k: v for k, v in meta.items()
+				if k not in ('.size', '.type')
+			}
+			for var, meta in d['.'].items()
+		}
+		yield d
+
+def stream(dd, state, dirname=None, **options):
+	"""Store datasets dd in the cache in dirname. The datasets are written to
+	a temporary directory, which is renamed to dirname at the end of the
+	stream, so that only complete caches are used."""
+	tmp = dirname + '.tmp'
+	if 'i' not in state:
+		shutil.rmtree(tmp, ignore_errors=True)
+		os.makedirs(tmp)
+		state['i'] = 0
+	for d in dd:
+		if d is None:
+			os.rename(tmp, dirname)
+			print('-> %s' % dirname)
+			break
+		if len(d['time']) == 0:
+			continue
+		ds.write(os.path.join(tmp, '%06d.nc' % state['i']), d)
+		state['i'] += 1
+	return dd
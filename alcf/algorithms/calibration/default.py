@@ -1,12 +1,10 @@
 from alcf import misc
 
 def calibration(d, calibration_coeff=1.0, **options):
-	if 'backscatter' in d:
-		d['backscatter'] *= calibration_coeff
-	if 'backscatter_mol' in d:
-		d['backscatter_mol'] *= calibration_coeff
-	if 'backscatter_sd' in d:
-		d['backscatter_sd'] *= calibration_coeff
+	for var in ['backscatter', 'backscatter_mol', 'backscatter_sd']:
+		if var in d:
+			x = misc.own(d, var)
+			x *= calibration_coeff
 
 def stream(dd, state, **options):
 	return misc.stream(dd, state, calibration, **options)
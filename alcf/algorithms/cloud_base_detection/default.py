@@ -4,39 +4,60 @@ import sys
 import numpy as np
 from alcf import misc
 
+def cloud_layers(cloud_mask, zfull):
+	"""Find cloud base height, cloud top height and the number of cloud layers
+	(continuous runs of cloudy levels) in cloud_mask of shape (time, level) or
+	(time, level, column)
+
+	zfull are heights of shape (level) or (time, level). Cloud base height is
+	inf and cloud top height is nan in profiles without clouds.
+	"""
+	mask = np.asarray(cloud_mask) != 0
+	n, m = mask.shape[:2]
+	extra = (1,)*(mask.ndim - 2)
+	cloudy = np.any(mask, axis=1)
+	kb = np.argmax(mask, axis=1)
+	kt = m - 1 - np.argmax(mask[:,::-1], axis=1)
+	start = mask.copy()
+	start[:,1:] &= ~mask[:,:-1]
+	nlayers = np.sum(start, axis=1, dtype=np.int32)
+	zfull = np.broadcast_to(zfull, (n, m)).reshape((n, m) + extra)
+	zfull = np.broadcast_to(zfull, mask.shape)
+	zb = np.take_along_axis(zfull, kb[:,np.newaxis,...], axis=1)[:,0,...]
+	zt = np.take_along_axis(zfull, kt[:,np.newaxis,...], axis=1)[:,0,...]
+	cbh = np.where(cloudy, zb, np.inf).astype(np.float64)
+	cth = np.where(cloudy, zt, np.nan).astype(np.float64)
+	return cbh, cth, nlayers
+
 def cloud_base_detection(d, **options):
 	cloud_mask = d['cloud_mask']
-	if len(cloud_mask.shape) == 3:
-		n, m, l = d['cloud_mask'].shape
-		dims = (n,l)
-		dimnames = ('time', 'column')
+	dims = d['.'].get('cloud_mask', {}).get('.dims',
+		['time', 'level', 'column'][:cloud_mask.ndim])
+	dimnames = [dims[0]] + list(dims[2:])
+	if cloud_mask.shape[1] == 0:
+		cbh = np.full(cloud_mask.shape[:1] + cloud_mask.shape[2:], np.inf)
+		cth = np.full(cbh.shape, np.nan)
+		nlayers = np.zeros(cbh.shape, np.int32)
 	else:
-		n, m = d['cloud_mask'].shape
-		l = 1
-		dims = (n,)
-		dimnames = ('time',)
-	cbh = np.zeros(dims, dtype=np.float64)
-	for i in range(n):
-		for j in range(l):
-			x = cloud_mask[i,:,j] if len(dims) == 2 \
-				else cloud_mask[i,:]
-			kk = np.where(x)[0]
-			if len(kk) > 0:
-				if len(dims) == 2:
-					cbh[i,j] = d['zfull'][kk[0]]
-				else:
-					cbh[i] = d['zfull'][kk[0]]
-			else:
-				if len(dims) == 2:
-					cbh[i,j] = np.inf
-				else:
-					cbh[i] = np.inf
+		cbh, cth, nlayers = cloud_layers(cloud_mask, d['zfull'])
 	d['cbh'] = cbh
 	d['.']['cbh'] = {
 		'.dims': dimnames,
 		'long_name': 'cloud base height',
 		'units': 'm',
 	}
+	d['cth'] = cth
+	d['.']['cth'] = {
+		'.dims': dimnames,
+		'long_name': 'cloud top height',
+		'units': 'm',
+	}
+	d['cloud_layers'] = nlayers
+	d['.']['cloud_layers'] = {
+		'.dims': dimnames,
+		'long_name': 'number of cloud layers',
+		'units': '1',
+	}
 
 def stream(dd, state, **options):
 	return misc.stream(dd, state, cloud_base_detection, **options)
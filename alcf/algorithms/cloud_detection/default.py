@@ -7,20 +7,81 @@ from scipy.stats import norm
 from scipy.optimize import minimize_scalar
 from alcf import misc
 
-def cloud_detection(d, cloud_threshold=2e-6, cloud_nsd=5, **options):
-	b = d['backscatter']
+def thresholds(cloud_threshold, cloud_nsd):
+	"""Get arrays of cloud detection thresholds and numbers of noise standard
+	deviations of a threshold sweep from cloud_threshold and cloud_nsd (lists
+	of the same length or single values)"""
+	try:
+		return np.broadcast_arrays(
+			np.atleast_1d(np.asarray(cloud_threshold, np.float64)),
+			np.atleast_1d(np.asarray(cloud_nsd, np.float64)),
+		)
+	except ValueError:
+		raise ValueError('cloud_threshold and cloud_nsd must be lists of the same length or single values')
+
+def cloud_detection_sweep(d, cloud_threshold, cloud_nsd, buf=None):
+	"""Detect clouds for every pair of cloud_threshold and cloud_nsd (see
+	thresholds). The cloud mask has an additional dimension threshold."""
+	b = np.ma.getdata(d['backscatter'])
+	if b.ndim != 2:
+		raise ValueError('Cloud detection threshold sweep is not supported for data with columns')
+	bsd = d.get('backscatter_sd')
+	bmol = d.get('backscatter_mol')
+	threshold, nsd = thresholds(cloud_threshold, cloud_nsd)
+	shape = b.shape + threshold.shape
+	# The same operations in the same precision as in cloud_detection, so that
+	# every threshold gives the same cloud mask as a separate run.
+	x = misc.scratch(buf if buf is not None else {}, 'x', shape, b.dtype)
+	if bsd is not None:
+		np.multiply(np.ma.getdata(bsd)[...,np.newaxis], nsd.astype(b.dtype),
+			out=x)
+		np.subtract(b[...,np.newaxis], x, out=x)
+	else:
+		x[...] = b[...,np.newaxis]
+	if bmol is not None:
+		x -= np.ma.getdata(bmol)[...,np.newaxis]
+	cloud_mask = np.empty(shape, np.byte)
+	np.greater_equal(x, threshold.astype(b.dtype), out=cloud_mask,
+		casting='unsafe')
+	d['cloud_mask'] = cloud_mask
+	d['.']['cloud_mask'] = {
+		'.dims': list(d['.']['backscatter']['.dims']) + ['threshold'],
+		'long_name': 'cloud mask',
+		'units': '1',
+	}
+	d['cloud_threshold'] = threshold
+	d['.']['cloud_threshold'] = {
+		'.dims': ['threshold'],
+		'long_name': 'cloud detection threshold',
+		'units': 'm-1 sr-1',
+	}
+	d['cloud_nsd'] = nsd
+	d['.']['cloud_nsd'] = {
+		'.dims': ['threshold'],
+		'long_name': 'cloud detection number of noise standard deviations',
+		'units': '1',
+	}
+
+def cloud_detection(d, cloud_threshold=2e-6, cloud_nsd=5, buf=None, **options):
+	if np.ndim(cloud_threshold) > 0 or np.ndim(cloud_nsd) > 0:
+		return cloud_detection_sweep(d, cloud_threshold, cloud_nsd, buf)
+	b = np.ma.getdata(d['backscatter'])
 	bsd = d.get('backscatter_sd')
 	bmol = d.get('backscatter_mol')
-	x = np.copy(b)
+	x = misc.scratch(buf if buf is not None else {}, 'x', b.shape, b.dtype)
 	if bsd is not None:
-		x -= cloud_nsd*bsd
+		np.multiply(cloud_nsd, np.ma.getdata(bsd), out=x)
+		np.subtract(b, x, out=x)
+	else:
+		x[...] = b
 	if bmol is not None:
-		if len(x.shape) == 3:
-			for i in range(x.shape[2]):
-				x[:,:,i] -= bmol
-		else:
-			x -= bmol
-	cloud_mask = (x >= cloud_threshold).astype(np.byte)
+		bmol = np.ma.getdata(bmol)
+		# Molecular backscatter is the same for all columns.
+		if bmol.ndim < x.ndim:
+			bmol = bmol[...,np.newaxis]
+		x -= bmol
+	cloud_mask = np.empty(b.shape, np.byte)
+	np.greater_equal(x, cloud_threshold, out=cloud_mask, casting='unsafe')
 	d['cloud_mask'] = cloud_mask
 	d['.']['cloud_mask'] = {
 		'.dims': d['.']['backscatter']['.dims'],
@@ -29,4 +90,5 @@ def cloud_detection(d, cloud_threshold=2e-6, cloud_nsd=5, **options):
 	}
 
 def stream(dd, state, **options):
-	return misc.stream(dd, state, cloud_detection, **options)
+	state['buf'] = state.get('buf', {})
+	return misc.stream(dd, state, cloud_detection, buf=state['buf'], **options)
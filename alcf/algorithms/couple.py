@@ -1,9 +1,13 @@
-import copy
+import os
+import json
+import logging
+import traceback
+import collections
 import numpy as np
 import ds_format as ds
 import aquarius_time as aq
 from alcf import misc
-from alcf.algorithms import interp
+from alcf.algorithms import interp_batch
 
 VARIABLES = [
 	'zfull',
@@ -11,15 +15,113 @@ VARIABLES = [
 	'backscatter_mol',
 ]
 
-def couple(d, d_idx):
+FILE_CACHE_SIZE = 4
+
+# Version of the index file format. Index files of other versions are
+# ignored.
+INDEX_VERSION = 1
+
+def read_index(filename):
+	"""Read time of profiles in files stored by write_index in filename. Returns
+	a dict of file names and tuples of the modification time and size of the
+	file and time, which is empty if filename does not exist or is not
+	valid."""
+	try:
+		with open(filename) as f:
+			x = json.load(f)
+		if x.get('version') != INDEX_VERSION:
+			return {}
+		return {
+			file_: ((mtime, size), np.array(time, np.float64))
+			for file_, (mtime, size, time) in x['files'].items()
+		}
+	except (OSError, ValueError, KeyError, TypeError):
+		return {}
+
+def write_index(filename, files):
+	"""Write time of profiles in files (see read_index) to filename"""
+	os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+	tmp = filename + '.tmp'
+	with open(tmp, 'w') as f:
+		json.dump({
+			'version': INDEX_VERSION,
+			'files': {
+				file_: [key[0], key[1], time.tolist()]
+				for file_, (key, time) in files.items()
+			},
+		}, f)
+	os.replace(tmp, filename)
+
+def index(dirname, index_file=None):
+	"""Build an index of profiles in files in directory dirname. If
+	index_file is not None, time of profiles is stored in index_file, and is
+	read only from files which are new or modified since the index file was
+	written."""
+	cached = read_index(index_file) if index_file is not None else {}
+	files = {}
+	for file_ in sorted(os.listdir(dirname)):
+		filename = os.path.join(dirname, file_)
+		if not os.path.isfile(filename):
+			continue
+		st = os.stat(filename)
+		key = (st.st_mtime_ns, st.st_size)
+		entry = cached.get(file_)
+		if entry is None or entry[0] != key:
+			try:
+				time = ds.read(filename, ['time'])['time']
+			except Exception:
+				logging.warning(traceback.format_exc())
+				continue
+			entry = (key, np.ma.getdata(time).astype(np.float64).ravel())
+		files[file_] = entry
+	if index_file is not None and (
+		files.keys() != cached.keys() or
+		any(files[file_][0] != cached[file_][0] for file_ in files)
+	):
+		write_index(index_file, files)
+	filenames = [os.path.join(dirname, file_) for file_ in files]
+	tt = [time for _, time in files.values()]
+	if len(tt) == 0:
+		raise ValueError('No data found in %s' % dirname)
+	time = np.concatenate(tt)
+	return {
+		'time': time,
+		'n': np.repeat(np.arange(len(tt)), [len(t) for t in tt]),
+		'i': np.concatenate([np.arange(len(t)) for t in tt]),
+		'filename': filenames,
+		'time_index': misc.time_index(time),
+	}
+
+def read_file(filename, cache):
+	"""Read coupled variables from a file, keeping the last FILE_CACHE_SIZE
+	files in cache (dict)"""
+	cache['files'] = cache.get('files', collections.OrderedDict())
+	files = cache['files']
+	if filename in files:
+		files.move_to_end(filename)
+		return files[filename]
+	d = ds.read(filename, VARIABLES + ['time'])
+	n = len(d['time'])
+	zfull = np.ma.getdata(d['zfull'])
+	m = zfull.shape[-1]
+	zfull = np.broadcast_to(zfull, (n, m))
+	y = np.full((n, m, 2), np.nan, np.float64)
+	for i, var in enumerate(['backscatter_sd', 'backscatter_mol']):
+		if var in d:
+			y[:,:,i] = np.ma.filled(np.ma.asarray(d[var], np.float64), np.nan)
+	files[filename] = (misc.half(zfull), y)
+	if len(files) > FILE_CACHE_SIZE:
+		files.popitem(last=False)
+	return files[filename]
+
+def couple(d, d_idx, cache=None):
 	dims = d['backscatter'].shape
 	n = dims[0]
-	l = dims[2] if len(dims) == 3 else 0
 	couple_bsd = False
 	couple_bmol = False
 	if 'backscatter_sd' not in d:
 		couple_bsd = True
-		d['backscatter_sd'] = np.full(dims, np.nan, np.float64)
+		d['backscatter_sd'] = np.full(dims, np.nan, d['backscatter'].dtype)
 		d['.']['backscatter_sd'] = {
 			'.dims': ['time', 'range', 'column'] \
 				if len(dims) == 3 \
@@ -29,43 +131,46 @@ def couple(d, d_idx):
 		}
 	if 'backsatter_mol' not in d:
 		couple_bmol = True
-		d['backscatter_mol'] = np.full(dims, np.nan, np.float64)
+		# Molecular backscatter is the same for all columns and is not
+		# repeated over the column axis.
+		d['backscatter_mol'] = np.full(dims[:2], np.nan, d['backscatter'].dtype)
 		d['.']['backscatter_mol'] = {
-			'.dims': ['time', 'range', 'column'] \
-				if len(dims) == 3 \
-				else ['time', 'range'],
+			'.dims': ['time', 'range'],
 			'long_name': 'total_attenuated_molecular_backscatter_coefficient',
 			'units': 'm-1 sr-1',
 		}
-	for i in range(n):
-		t = d['time'][i]
-		j = np.argmin(np.abs(d_idx['time'] - t))
-		n1 = d_idx['n'][j]
-		filename = d_idx['filename'][n1]
-		i1 = d_idx['i'][j]
-		d1 = ds.read(filename, VARIABLES, {'time': i1})
-		zhalf1 = misc.half(d1['zfull'])
-		zhalf = misc.half(d['zfull'][i,:]) \
-			if d['zfull'].ndim == 2 \
-			else misc.half(d['zfull'])
-		if couple_bsd and 'backscatter_sd' in d1:
-			b_sd = interp(zhalf1, d1['backscatter_sd'], zhalf)
-			if len(dims) == 3:
-				for k in range(l):
-					d['backscatter_sd'][i,:,k] = b_sd
-			else:
-				d['backscatter_sd'][i,:] = b_sd
-		if couple_bmol and 'backscatter_mol' in d1:
-			b_mol = interp(zhalf1, d1['backscatter_mol'], zhalf)
-			if len(dims) == 3:
-				for k in range(l):
-					d['backscatter_mol'][i,:,k] = b_mol
-			else:
-				d['backscatter_mol'][i,:] = b_mol
+	if n == 0:
+		return
+	if cache is None:
+		cache = {}
+	zhalf = misc.half(d['zfull'])
+	j = misc.time_nearest(d_idx['time_index'], d['time'])
+	nn = d_idx['n'][j]
+	# Variables of the nearest profiles are read by file and interpolated
+	# once for every source profile (or pair of source and target profiles
+	# if the target levels are time-dependent).
+	y = np.empty((n, zhalf.shape[-1] - 1, 2), np.float64)
+	for n1 in np.unique(nn):
+		mask = nn == n1
+		zhalf1, y1 = read_file(d_idx['filename'][n1], cache)
+		u, inv = np.unique(d_idx['i'][j[mask]], return_inverse=True)
+		inv = inv.ravel()
+		if zhalf.ndim == 1:
+			y[mask] = interp_batch(zhalf1[u], y1[u], zhalf)[inv]
+		else:
+			y[mask] = interp_batch(zhalf1[u][inv], y1[u][inv], zhalf[mask])
+	if couple_bsd:
+		d['backscatter_sd'][...] = y[:,:,0,np.newaxis] \
+			if len(dims) == 3 \
+			else y[:,:,0]
+	if couple_bmol:
+		d['backscatter_mol'][...] = y[:,:,1]
 
-def stream(dd, state, dirname):
+def stream(dd, state, dirname, index_file=None):
 	if 'd_idx' not in state:
-		d_idx = ds.readdir(dirname, ['time'], merge='time')
-		state['d_idx'] = d_idx
-	return misc.stream(dd, state, couple, d_idx=state['d_idx'])
-
+		state['d_idx'] = index(dirname, index_file)
+	state['cache'] = state.get('cache', {})
+	return misc.stream(dd, state, couple,
+		d_idx=state['d_idx'],
+		cache=state['cache'],
+	)
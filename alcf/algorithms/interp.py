@@ -1,4 +1,8 @@
+import functools
 import numpy as np
+import scipy.sparse
+
+OPERATOR_CACHE_SIZE = 64
 
 def interp(xhalf, y, xhalf2):
 	"""Interpolate y(x) on x2"""
@@ -32,3 +36,131 @@ def interp(xhalf, y, xhalf2):
 			y2[i2] /= dx2
 		i2 += 1
 	return y2
+
+def search(xhalf, x):
+	"""Find index of the last element of xhalf less or equal to x
+
+	xhalf is a sorted array of shape (m) or (n, m). If xhalf is 2D, it is
+	searched row-wise and x must be of shape (k) or (n, k).
+	"""
+	if xhalf.ndim == 1:
+		return np.searchsorted(xhalf, x, side='right') - 1
+	n, m = xhalf.shape
+	x = np.broadcast_to(x, (n, x.shape[-1]))
+	z = np.concatenate([xhalf, x], axis=1)
+	# Stable sort places elements of xhalf before equal elements of x.
+	order = np.argsort(z, axis=1, kind='stable')
+	count = np.cumsum(order < m, axis=1)
+	pos = np.empty_like(order)
+	np.put_along_axis(pos, order, np.arange(z.shape[1])[np.newaxis,:], axis=1)
+	return np.take_along_axis(count, pos[:,m:], axis=1) - 1
+
+@functools.lru_cache(maxsize=OPERATOR_CACHE_SIZE)
+def _interp_operator(xhalf, xhalf2):
+	xhalf = np.frombuffer(xhalf, dtype=np.float64)
+	xhalf2 = np.frombuffer(xhalf2, dtype=np.float64)
+	m = len(xhalf) - 1
+	m2 = len(xhalf2) - 1
+	x2 = np.clip(xhalf2, xhalf[0], xhalf[-1])
+	k1 = np.clip(np.searchsorted(xhalf, x2[:-1], side='right') - 1, 0, m - 1)
+	k2 = np.clip(np.searchsorted(xhalf, x2[1:], side='left') - 1, 0, m - 1)
+	count = np.maximum(k2 - k1 + 1, 0)
+	rows = np.repeat(np.arange(m2), count)
+	cols = np.repeat(k1 - np.cumsum(count) + count, count) + np.arange(len(rows))
+	w = np.minimum(xhalf[cols+1], x2[rows+1]) - np.maximum(xhalf[cols], x2[rows])
+	mask = w > 0
+	rows, cols, w = rows[mask], cols[mask], w[mask]
+	w /= np.bincount(rows, weights=w, minlength=m2)[rows]
+	return scipy.sparse.csr_matrix((w, (rows, cols)), shape=(m2, m))
+
+def interp_operator(xhalf, xhalf2):
+	"""Get a sparse matrix W of shape (m2, m) such that W @ y is equal to
+	interp(xhalf, y, xhalf2)
+
+	Operators are cached for the last OPERATOR_CACHE_SIZE pairs of source and
+	target half-levels.
+	"""
+	return _interp_operator(
+		np.ascontiguousarray(xhalf, dtype=np.float64).tobytes(),
+		np.ascontiguousarray(xhalf2, dtype=np.float64).tobytes(),
+	)
+
+def apply_operator(w, y, dtype=np.float64):
+	"""Apply operator w to y of shape (n, m) or (n, m, l) along the level
+	axis"""
+	n, m = y.shape[:2]
+	x = np.moveaxis(y, 1, 0).reshape(m, -1)
+	y2 = np.asarray(w @ x, dtype=dtype)
+	y2 = y2.reshape((w.shape[0], n) + y.shape[2:])
+	return np.moveaxis(y2, 0, 1)
+
+def interp_batch(xhalf, y, xhalf2):
+	"""Interpolate y(x) on x2 for a block of profiles
+
+	xhalf are source half-levels of shape (m + 1) or (n, m + 1), y is an
+	array of shape (n, m) or (n, m, l) and xhalf2 are target half-levels of
+	shape (m2 + 1) or (n, m2 + 1). Returns an array of shape (n, m2) or
+	(n, m2, l) equal to the result of interp applied to every profile and
+	column. NaN and masked values in y propagate to all overlapping target
+	levels. The result is of the same floating point type as y (float64 if y is not
+	floating point), but is calculated in float64.
+
+	Profiles which share the same half-levels are interpolated with a cached
+	operator (see interp_operator). Otherwise, interp_integral is used.
+	"""
+	xhalf = np.asarray(xhalf, dtype=np.float64)
+	xhalf2 = np.asarray(xhalf2, dtype=np.float64)
+	y = np.ma.asarray(y)
+	dtype = y.dtype if np.issubdtype(y.dtype, np.floating) else np.float64
+	y = np.ma.filled(y.astype(dtype, copy=False), np.nan)
+	n, m = y.shape[:2]
+	m2 = xhalf2.shape[-1] - 1
+	if m == 0:
+		return np.zeros((n, m2) + y.shape[2:], dtype=dtype)
+	if xhalf.ndim == 1 and xhalf2.ndim == 1:
+		return apply_operator(interp_operator(xhalf, xhalf2), y, dtype)
+	grids = np.concatenate([
+		np.broadcast_to(xhalf, (n, m + 1)),
+		np.broadcast_to(xhalf2, (n, m2 + 1)),
+	], axis=1)
+	u, inv = np.unique(grids, axis=0, return_inverse=True)
+	inv = inv.ravel()
+	if len(u) > n//2:
+		return interp_integral(xhalf, y, xhalf2).astype(dtype, copy=False)
+	y2 = np.empty((n, m2) + y.shape[2:], dtype=dtype)
+	for i, grid in enumerate(u):
+		mask = inv == i
+		w = interp_operator(grid[:(m + 1)], grid[(m + 1):])
+		y2[mask] = apply_operator(w, y[mask], dtype)
+	return y2
+
+def interp_integral(xhalf, y, xhalf2):
+	"""Interpolate y(x) on x2 for a block of profiles using cumulative
+	integrals (see interp_batch)"""
+	n, m = y.shape[:2]
+	extra = (1,)*(y.ndim - 2)
+	m2 = xhalf2.shape[-1] - 1
+	x2 = np.clip(xhalf2, xhalf[...,:1], xhalf[...,-1:])
+	x2 = np.broadcast_to(x2, (n, m2 + 1))
+	k = np.clip(search(xhalf, x2), 0, m - 1)
+	xk = np.take_along_axis(np.broadcast_to(xhalf, (n, m + 1)), k, axis=1)
+	dx = np.broadcast_to(np.diff(xhalf, axis=-1), (n, m)).reshape((n, m) + extra)
+	nan = np.isnan(y)
+	y0 = np.where(nan, 0., y)
+	# Cumulative integrals of y and of its NaN mask at the source half-levels
+	# and at the target half-levels.
+	c = np.zeros((n, m + 1) + y.shape[2:], dtype=np.float64)
+	c_nan = np.zeros((n, m + 1) + y.shape[2:], dtype=np.float64)
+	np.cumsum(y0*dx, axis=1, out=c[:,1:])
+	np.cumsum(nan*dx, axis=1, out=c_nan[:,1:])
+	kk = k.reshape(k.shape + extra)
+	dxk = (x2 - xk).reshape(k.shape + extra)
+	f = np.take_along_axis(c, kk, axis=1) + \
+		np.take_along_axis(y0, kk, axis=1)*dxk
+	f_nan = np.take_along_axis(c_nan, kk, axis=1) + \
+		np.take_along_axis(nan, kk, axis=1)*dxk
+	w = np.diff(x2, axis=1).reshape((n, m2) + extra)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		y2 = np.where(w > 0, np.diff(f, axis=1)/w, 0.)
+	y2[np.broadcast_to(np.diff(f_nan, axis=1) > 0, y2.shape)] = np.nan
+	return y2
@@ -0,0 +1,133 @@
+import numpy as np
+
+try:
+	import numba
+except ImportError:
+	numba = None
+
+# Kernels are compiled with Numba if it is installed. Otherwise, equivalent
+# NumPy implementations are used. Both backends give identical results.
+BACKEND = 'numba' if numba is not None else 'numpy'
+
+def _backend(backend):
+	backend = BACKEND if backend is None else backend
+	if backend not in ('numpy', 'numba'):
+		raise ValueError('Invalid backend: %s' % backend)
+	if backend == 'numba' and numba is None:
+		raise ValueError('Numba is not installed')
+	return backend
+
+def _as3d(x, sel):
+	"""Get arrays x of shape (n, m) or (n, m, l) and sel of shape (n) or
+	(n, l) as arrays of shape (n, m, l) and (n, l)"""
+	x = np.ma.getdata(x)
+	if x.ndim == 2:
+		return x[:,:,np.newaxis], np.asarray(sel)[:,np.newaxis]
+	return x, np.asarray(sel)
+
+def histogram_levels(x, sel, half, backend=None):
+	"""Calculate histograms of x of shape (n, m) or (n, m, l) at every level
+	(m) and column (l) over profiles (n) selected by sel (of shape (n) or
+	(n, l)) with bins half, as np.histogram. Returns an array of counts of
+	shape (o, m) or (o, m, l), where o is the number of bins."""
+	x3, sel3 = _as3d(x, sel)
+	half = np.asarray(half, np.float64)
+	if _backend(backend) == 'numba':
+		h = _histogram_levels_numba(x3, sel3, half)
+	else:
+		h = _histogram_levels_numpy(x3, sel3, half)
+	return h if x.ndim == 3 else h[:,:,0]
+
+def _histogram_levels_numpy(x, sel, half):
+	n, m, l = x.shape
+	o = len(half) - 1
+	k = np.searchsorted(half, x, side='right') - 1
+	# The last bin includes its right edge.
+	k[x == half[-1]] = o - 1
+	valid = (k >= 0) & (k < o) & sel[:,np.newaxis,:]
+	j = np.broadcast_to(np.arange(m*l).reshape(1, m, l), x.shape)
+	h = np.bincount(k[valid]*m*l + j[valid], minlength=o*m*l)
+	return h.reshape(o, m, l).astype(np.float64)
+
+def profile_sums(cloud_mask, b, bmol, sel, backend=None):
+	"""Sum cloud mask and backscatter of shape (n, m) or (n, m, l) and
+	molecular backscatter of shape (n, m) (or None) over profiles (n)
+	selected by sel (of shape (n) or (n, l)) for every column (l). Profiles
+	are summed in order. Returns a tuple of the sum of the cloud mask, the
+	sum of backscatter, the sum of molecular backscatter (of shape (m) or
+	(m, l)), the number of profiles and the number of cloudy profiles (of
+	shape (l) or scalar)."""
+	cm3, sel3 = _as3d(cloud_mask, sel)
+	b3 = _as3d(b, sel)[0]
+	n, m, l = b3.shape
+	bmol = np.zeros((n, m)) if bmol is None else np.ma.getdata(bmol)
+	if _backend(backend) == 'numba':
+		res = _profile_sums_numba(cm3, b3, bmol, sel3)
+	else:
+		res = _profile_sums_numpy(cm3, b3, bmol, sel3)
+	if b.ndim == 3:
+		return res
+	return tuple([x[...,0] for x in res[:3]] + [x[0] for x in res[3:]])
+
+def _profile_sums_numpy(cloud_mask, b, bmol, sel):
+	n, m, l = b.shape
+	cl = np.zeros((m, l), np.float64)
+	bsum = np.zeros((m, l), np.float64)
+	bmolsum = np.zeros((m, l), np.float64)
+	count = np.zeros(l, np.int64)
+	clt = np.zeros(l, np.float64)
+	for k in range(l):
+		s = sel[:,k]
+		# Sums over the first axis add the rows in order.
+		cm = cloud_mask[s,:,k].astype(np.float64)
+		cl[:,k] = np.sum(cm, axis=0)
+		bsum[:,k] = np.sum(b[s,:,k].astype(np.float64), axis=0)
+		bmolsum[:,k] = np.sum(bmol[s].astype(np.float64), axis=0)
+		count[k] = np.sum(s)
+		clt[k] = np.sum(np.any(cm != 0, axis=1))
+	return cl, bsum, bmolsum, count, clt
+
+if numba is not None:
+	@numba.njit(cache=True)
+	def _histogram_levels_numba(x, sel, half):
+		n, m, l = x.shape
+		o = len(half) - 1
+		h = np.zeros((o, m, l), np.float64)
+		for i in range(n):
+			for j in range(m):
+				for k in range(l):
+					if not sel[i,k]:
+						continue
+					v = x[i,j,k]
+					if np.isnan(v):
+						continue
+					if v == half[o]:
+						h[o - 1,j,k] += 1
+						continue
+					q = np.searchsorted(half, v, side='right') - 1
+					if q >= 0 and q < o:
+						h[q,j,k] += 1
+		return h
+
+	@numba.njit(cache=True)
+	def _profile_sums_numba(cloud_mask, b, bmol, sel):
+		n, m, l = b.shape
+		cl = np.zeros((m, l), np.float64)
+		bsum = np.zeros((m, l), np.float64)
+		bmolsum = np.zeros((m, l), np.float64)
+		count = np.zeros(l, np.int64)
+		clt = np.zeros(l, np.float64)
+		for i in range(n):
+			for k in range(l):
+				if not sel[i,k]:
+					continue
+				cloudy = False
+				for j in range(m):
+					cl[j,k] += cloud_mask[i,j,k]
+					bsum[j,k] += b[i,j,k]
+					bmolsum[j,k] += bmol[i,j]
+					if cloud_mask[i,j,k] != 0:
+						cloudy = True
+				count[k] += 1
+				clt[k] += cloudy
+		return cl, bsum, bmolsum, count, clt
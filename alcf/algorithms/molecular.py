@@ -0,0 +1,123 @@
+import numpy as np
+
+# Layers of the U.S. Standard Atmosphere 1976: base height (m) and
+# temperature lapse rate (K m-1).
+LAYERS = [
+	(0., -0.0065),
+	(11000., 0.),
+	(20000., 0.001),
+	(32000., 0.0028),
+	(47000., 0.),
+	(51000., -0.0028),
+	(71000., -0.002),
+]
+T0 = 288.15 # K
+P0 = 101325. # Pa
+G = 9.80665 # m s-2
+R = 287.053 # J kg-1 K-1
+K_B = 1.380649e-23 # J K-1
+
+def layer(tb, pb, lapse, dz):
+	"""Temperature and pressure at height dz above the base of a layer with
+	base temperature tb, base pressure pb and temperature lapse rate lapse"""
+	t = tb + lapse*dz
+	if lapse == 0:
+		return t, pb*np.exp(-G*dz/(R*tb))
+	return t, pb*(t/tb)**(-G/(R*lapse))
+
+def standard_atmosphere(z, dt=0.):
+	"""Temperature (K) and pressure relative to the sea level pressure at
+	heights z (m) in the standard atmosphere with temperature shifted by dt
+	(K)"""
+	z = np.asarray(z, np.float64)
+	t = np.zeros(z.shape)
+	p = np.zeros(z.shape)
+	tb, pb = T0 + dt, 1.
+	for i, (zb, lapse) in enumerate(LAYERS):
+		mask = z >= zb if i > 0 else np.ones(z.shape, bool)
+		t[mask], p[mask] = layer(tb, pb, lapse, z[mask] - zb)
+		if i + 1 < len(LAYERS):
+			tb, pb = layer(tb, pb, lapse, LAYERS[i + 1][0] - zb)
+	return t, p
+
+def atmosphere(z, altitude=0., surface_pressure=None, surface_temperature=None):
+	"""Temperature (K) and pressure (Pa) at heights z (m) in the standard
+	atmosphere. If surface_temperature (K) or surface_pressure (Pa) are
+	given, temperature is shifted and pressure is scaled to match them at
+	altitude (m)."""
+	dt = 0.
+	if surface_temperature is not None:
+		dt = surface_temperature - standard_atmosphere(altitude)[0]
+	t, p = standard_atmosphere(z, dt)
+	if surface_pressure is not None:
+		p *= surface_pressure/standard_atmosphere(altitude, dt)[1]
+	else:
+		p *= P0
+	return t, p
+
+def backscatter_mol(zfull, wavelength,
+	altitude=0.,
+	surface_pressure=None,
+	surface_temperature=None,
+	surface_lidar=True,
+):
+	"""Calculate total attenuated molecular backscatter (m-1 sr-1) at heights
+	zfull (m) for a lidar at wavelength (nm) at altitude (m) in the standard
+	atmosphere (see atmosphere). The molecular backscattering cross section
+	is 5.45e-32 (550/wavelength)^4 m2 sr-1 (Collis and Russell, 1976) and the
+	extinction-to-backscatter ratio is 8π/3. Attenuation is calculated from
+	altitude for a surface lidar and from the highest level otherwise."""
+	zfull = np.asarray(zfull, np.float64)
+	z0 = altitude if surface_lidar else np.max(zfull)
+	z = np.sort(np.append(zfull, z0))
+	t, p = atmosphere(z, altitude, surface_pressure, surface_temperature)
+	beta = p/(K_B*t)*5.45e-32*(550./wavelength)**4
+	alpha = 8.*np.pi/3.*beta
+	tau = np.concatenate([[0.], np.cumsum(0.5*(alpha[1:] + alpha[:-1])*np.diff(z))])
+	tau = np.abs(np.interp(zfull, z, tau) - np.interp(z0, z, tau))
+	return np.interp(zfull, z, beta)*np.exp(-2.*tau)
+
+def profile(state, zfull, altitude, **options):
+	"""Get molecular backscatter at zfull and altitude, reusing the last
+	calculated profile stored in state if they are the same"""
+	key = (zfull.tobytes(), float(altitude))
+	if state.get('key') != key:
+		state['key'] = key
+		state['profile'] = backscatter_mol(zfull, altitude=altitude, **options)
+	return state['profile']
+
+def stream(dd, state, wavelength=None, **options):
+	"""Add molecular backscatter calculated in the standard atmosphere to
+	datasets dd which do not contain it. The profile is calculated once for
+	every height grid and altitude and broadcast over time."""
+	for d in dd:
+		if d is None:
+			break
+		if 'backscatter_mol' in d:
+			continue
+		n = len(d['time'])
+		zfull = np.ma.getdata(d['zfull']).astype(np.float64)
+		altitude = np.ma.filled(d['altitude'], np.nan).astype(np.float64) \
+			if 'altitude' in d else np.full(n, np.nan)
+		# Missing altitude (such as in empty time bins) is taken from other
+		# profiles or is 0 if not available.
+		ok = np.isfinite(altitude)
+		altitude[~ok] = altitude[ok][0] if np.any(ok) else 0.
+		dtype = d['backscatter'].dtype
+		if zfull.ndim == 1 and np.all(altitude == altitude[:1]):
+			bmol = profile(state, zfull, altitude[0],
+				wavelength=wavelength, **options) if n > 0 else zfull
+			bmol = np.broadcast_to(bmol.astype(dtype), (n, len(zfull)))
+		else:
+			zfull = np.broadcast_to(zfull, (n, zfull.shape[-1]))
+			bmol = np.empty(zfull.shape, dtype)
+			for i in range(n):
+				bmol[i] = profile(state, zfull[i], altitude[i],
+					wavelength=wavelength, **options)
+		d['backscatter_mol'] = bmol
+		d['.']['backscatter_mol'] = {
+			'.dims': list(d['.']['backscatter']['.dims'][:2]),
+			'long_name': 'total_attenuated_molecular_backscatter_coefficient',
+			'units': 'm-1 sr-1',
+		}
+	return dd
@@ -1,31 +1,99 @@
 import numpy as np
 from alcf import misc
 
-def noise_removal(d, **options):
-	b = d['backscatter']
+def noise_removal(d, noise_m, noise_sd, buf=None):
+	b = misc.own(d, 'backscatter')
 	zfull = d['zfull']
-	bt = b[:,-1]
-	n, m = b.shape
-	b2 = np.zeros((n, m), np.float64)
-	b_sd = np.zeros((n, m), np.float64)
-	w = d['time_bnds'][:,1] - d['time_bnds'][:,0]
-	noise_m = np.average(bt, weights=w)
-	noise_sd = np.sqrt(np.cov(bt, aweights=w))
-	for i in range(n):
-		c = (1.0*zfull[i,:]/zfull[i,-1])**2
-		b2[i,:] = b[i,:] - noise_m*c
-		b_sd[i,:] = noise_sd*c
-	d['backscatter'] = b2
-	d['backscatter_sd'] = b_sd
+	c = (1.0*zfull/zfull[...,-1:])**2
+	noise_m = noise_m.astype(b.dtype)[:,np.newaxis]
+	noise_sd = noise_sd.astype(b.dtype)[:,np.newaxis]
+	x = misc.scratch(buf if buf is not None else {}, 'x', b.shape, b.dtype)
+	np.multiply(noise_m, c, out=x)
+	b -= x
+	d['backscatter_sd'] = np.multiply(noise_sd, c, out=np.empty(b.shape, b.dtype))
 	d['.']['backscatter_sd'] = {
 		'.dims': ['time', 'range'],
 		'long_name': 'total attenuated volume backscattering coefficient standard deviation',
 		'units': 'm-1 sr-1',
 	}
 
+def window_stats(t, w, x, t1, t2):
+	"""Calculate the weighted mean and standard deviation of values x with
+	weights w at times t (sorted) within time windows [t1, t2]. The standard
+	deviation is calculated as in np.cov with aweights."""
+	def csum(y):
+		return np.concatenate([[0.], np.cumsum(y)])
+	i1 = np.searchsorted(t, t1, side='left')
+	i2 = np.searchsorted(t, t2, side='right')
+	sw, sw2, swx, swx2 = [
+		s[i2] - s[i1] for s in [csum(w), csum(w**2), csum(w*x), csum(w*x**2)]
+	]
+	with np.errstate(divide='ignore', invalid='ignore'):
+		m = swx/sw
+		var = (swx2 - sw*m**2)/(sw - sw2/sw)
+	return m, np.sqrt(np.maximum(var, 0.))
+
+def flush(state, tready, h):
+	"""Remove noise in pending profiles with time up to tready and return
+	them. Times are in units of misc.time_units."""
+	t = state['t']
+	ready = []
+	while len(state['pending']) > 0:
+		d = state['pending'][0]
+		n = np.searchsorted(misc.time_units(d)[0], tready, side='right')
+		if n == 0:
+			break
+		if n < len(d['time']):
+			ready += [misc.select_time(d, 0, n)]
+			state['pending'][0] = misc.select_time(d, n, len(d['time']))
+			break
+		ready += [d]
+		state['pending'].pop(0)
+	for d in ready:
+		time = misc.time_units(d)[0]
+		m, sd = window_stats(t, state['w'], state['x'], time - h, time + h)
+		noise_removal(d, m + state['ref'], sd, state['buf'])
+	# Keep only values in the windows of the remaining pending profiles.
+	if len(state['pending']) > 0:
+		time = misc.time_units(state['pending'][0])[0]
+		i = np.searchsorted(t, time[0] - h, side='left')
+		for var in ['t', 'w', 'x']:
+			state[var] = state[var][i:]
+	return ready
+
 def stream(dd, state, noise_removal_sampling=300, **options):
-	state['aggregate_state'] = state.get('aggregate_state', {})
-	dd = misc.aggregate(dd, state['aggregate_state'],
-		noise_removal_sampling/60./60./24.
-	)
-	return misc.stream(dd, state, noise_removal, **options)
+	"""Remove noise estimated as the weighted mean and standard deviation of
+	backscatter in the highest range gate within a moving window of length
+	noise_removal_sampling (s) centered on every profile. Profiles are passed
+	on as soon as their window is complete, i.e. with a delay of half of the
+	window."""
+	for var in ['t', 'w', 'x']:
+		state[var] = state.get(var, np.zeros(0, np.float64))
+	state['pending'] = state.get('pending', [])
+	state['buf'] = state.get('buf', {})
+	ddo = []
+	for d in dd:
+		if d is None:
+			ddo += flush(state, np.inf, state.get('h', 0.)) + [None]
+			break
+		if len(d['time']) == 0:
+			continue
+		time, time_bnds, [p], _ = misc.time_units(d,
+			[noise_removal_sampling/86400.])
+		h = 0.5*p
+		x = np.ma.filled(np.ma.asarray(d['backscatter'][:,-1], np.float64), np.nan)
+		w = (time_bnds[:,1] - time_bnds[:,0]).astype(np.float64)
+		# Missing values are excluded by zero weight. Values are accumulated
+		# relative to the first value to avoid loss of precision in the
+		# variance.
+		mask = np.isfinite(x)
+		state['ref'] = state.get('ref', x[mask][0] if np.any(mask) else 0.)
+		state['t'] = np.concatenate([state['t'], time])
+		state['w'] = np.concatenate([state['w'], np.where(mask, w, 0.)])
+		state['x'] = np.concatenate([state['x'],
+			np.where(mask, x - state['ref'], 0.)
+		])
+		state['pending'] += [d]
+		state['h'] = h
+		ddo += flush(state, time[-1] - h, h)
+	return ddo
@@ -1,63 +1,93 @@
-import copy
 import numpy as np
+import scipy.sparse
 from alcf import misc
 import ds_format as ds
 
-def output_sample(d, tres, output_sampling):
-	t = d['time_bnds'][0,0]
-	r = (t + 0.5) % output_sampling
-	t1 = t - r
-	t2 = t1 + output_sampling
+def operator(time_bnds, time_half2):
+	"""Get a sparse matrix W of shape (n2, n) of overlaps of time intervals
+	time_bnds with bins time_half2 (in the same units), normalized to a sum
+	of one in every non-empty bin"""
+	n = len(time_bnds)
+	n2 = len(time_half2) - 1
+	k1 = np.clip(np.searchsorted(time_half2, time_bnds[:,0], side='right') - 1, 0, n2 - 1)
+	k2 = np.clip(np.searchsorted(time_half2, time_bnds[:,1], side='left') - 1, 0, n2 - 1)
+	count = np.maximum(k2 - k1 + 1, 0)
+	ii = np.repeat(np.arange(n), count)
+	jj = np.repeat(k1 - np.cumsum(count) + count, count) + np.arange(len(ii))
+	w = (np.minimum(time_bnds[ii,1], time_half2[jj+1]) - \
+		np.maximum(time_bnds[ii,0], time_half2[jj])).astype(np.float64)
+	mask = w > 0
+	ii, jj, w = ii[mask], jj[mask], w[mask]
+	w /= np.bincount(jj, weights=w, minlength=n2)[jj]
+	return scipy.sparse.csr_matrix((w, (jj, ii)), shape=(n2, n))
 
-	dims = ds.get_dims(d)
-	n = dims['time']
-	n2 = int(output_sampling/tres)
-	time = d['time']
-	time_bnds = d['time_bnds']
+def output_sample(d, tres, output_sampling, skip_empty=False):
+	_, time_bnds, [p, p2], unit = misc.time_units(d, [tres, output_sampling])
+	t1 = (time_bnds[0,0] // p2)*p2
+	n2 = int(np.round(p2/p))
+	time_half2 = t1 + np.arange(n2 + 1)*p
+	w = operator(time_bnds, time_half2)
+	empty = w.getnnz(axis=1) == 0
+	if skip_empty:
+		w = w[~empty]
+		time_half2 = np.stack([time_half2[:-1], time_half2[1:]], axis=1)[~empty]
+		empty = empty[~empty]
+	else:
+		time_half2 = np.stack([time_half2[:-1], time_half2[1:]], axis=1)
 
-	time_half2 = np.linspace(t1, t2, n2 + 1)
-	time2 = 0.5*(time_half2[1:] + time_half2[:-1])
+	for var in ds.get_vars(d):
+		if var in ('time', 'time_bnds', 'time_ticks', 'time_bnds_ticks') or \
+			'time' not in d['.'][var]['.dims']:
+			continue
+		i = d['.'][var]['.dims'].index('time')
+		x = np.moveaxis(d[var], i, 0)
+		# The sparse product ignores the mask. Masked values are NaN, so that
+		# output bins overlapping them are NaN.
+		if np.ma.isMaskedArray(x):
+			if not np.issubdtype(x.dtype, np.floating):
+				x = x.astype(np.float64)
+			x = np.ma.filled(x, np.nan)
+		x2 = np.asarray(w @ x.reshape(x.shape[0], -1), dtype=x.dtype)
+		x2[empty] = np.nan
+		d[var] = np.moveaxis(x2.reshape((w.shape[0],) + x.shape[1:]), 0, i)
+	misc.set_time_bnds(d, time_half2, unit, np.mean(time_half2, axis=1))
 
+def fill_empty(d):
+	"""Insert empty time bins omitted by output_sample with skip_empty into
+	dataset d"""
+	if len(d['time']) == 0:
+		return
+	time_bnds = d['time_bnds']
+	tres = time_bnds[0,1] - time_bnds[0,0]
+	j = np.round((time_bnds[:,0] - time_bnds[0,0])/tres).astype(np.int64)
+	n2 = j[-1] + 1
+	if n2 == len(j):
+		return
 	for var in ds.get_vars(d):
-		if 'time' not in d['.'][var]['.dims']:
+		if var in ('time', 'time_bnds') or 'time' not in d['.'][var]['.dims']:
 			continue
 		i = d['.'][var]['.dims'].index('time')
-		x = d[var]
-		size = x.shape
-		size2 = list(size)
-		size2[i] = n2
-		x2 = np.full(size2, np.nan, dtype=x.dtype)
-		for j in range(n2):
-			mask = np.maximum(0,
-				np.minimum(time_bnds[:,1], time_half2[j + 1]) -
-				np.maximum(time_bnds[:,0], time_half2[j])
-			)
-			s = np.sum(mask)
-			if s > 0.:
-				mask /= np.sum(mask)
-			sel2 = tuple([
-				slice(None) if l != i else j
-				for l in range(len(size))
-			])
-			for k in np.argwhere(mask > 0):
-				sel = tuple([
-					slice(None) if l != i else k
-					for l in range(len(size))
-				])
-				x2[sel2] = np.where(np.isnan(x2[sel2])*mask[k], 0, x2[sel2]) + \
-					x[sel]*mask[k]
-		d[var] = x2
-	d['time'] = time2
-	d['time_bnds'] = np.full((n2, 2), np.nan, np.float64)
-	d['time_bnds'][:,0] = time_half2[:-1]
-	d['time_bnds'][:,1] = time_half2[1:]
+		x = np.moveaxis(d[var], i, 0)
+		x2 = np.full((n2,) + x.shape[1:],
+			np.nan if np.issubdtype(x.dtype, np.floating) else 0,
+			dtype=x.dtype
+		)
+		x2[j] = x
+		d[var] = np.moveaxis(x2, 0, i)
+	d['time_bnds'] = time_bnds[0,0] + np.stack([
+		np.arange(n2)*tres,
+		(np.arange(n2) + 1)*tres,
+	], axis=1)
+	d['time'] = np.mean(d['time_bnds'], axis=1)
 
-def stream(dd, state, tres=None, tlim=None, output_sampling=None, **options):
+def stream(dd, state, tres=None, tlim=None, output_sampling=None,
+	skip_empty=False, **options):
 	if tres is not None:
 		state['aggregate_state'] = state.get('aggregate_state', {})
 		dd = misc.aggregate(dd, state['aggregate_state'], output_sampling)
 		return misc.stream(dd, state, output_sample,
 			tres=tres,
-			output_sampling=output_sampling
+			output_sampling=output_sampling,
+			skip_empty=skip_empty,
 		)
 	return dd
@@ -1,7 +1,30 @@
 import numpy as np
-from alcf.algorithms import interp
+from alcf.algorithms import interp_batch, kernels
 from alcf import misc
 
+def threshold_columns(d, state):
+	"""Treat the threshold dimension of the cloud mask of a cloud detection
+	threshold sweep in dataset d as columns, broadcasting backscatter to
+	them"""
+	if 'threshold' not in d['.']['cloud_mask']['.dims']:
+		return
+	if d['backscatter'].ndim != 2:
+		raise ValueError('Cloud detection threshold sweep is not supported for data with columns')
+	shape = d['cloud_mask'].shape
+	for var in ['backscatter', 'backscatter_sd']:
+		if var in d:
+			x = np.ma.filled(d[var], np.nan)
+			d[var] = np.broadcast_to(x[...,np.newaxis], shape)
+	state['column'] = 'threshold'
+	state['thresholds'] = {
+		var: (d[var], {
+			k: v for k, v in d['.'][var].items()
+			if k not in ('.size', '.type')
+		})
+		for var in ['cloud_threshold', 'cloud_nsd']
+		if var in d
+	}
+
 def stats_map(d, state,
 	tlim=None,
 	blim=None,
@@ -21,6 +44,7 @@ def stats_map(d, state,
 		)
 	else:
 		state['zfull2'] = state.get('zfull2', d['zfull'])
+	threshold_columns(d, state)
 	zhalf = misc.half(d['zfull'])
 	zhalf2 = misc.half(state['zfull2'])
 	state['backscatter_half'] = state.get('backscatter_half',
@@ -116,16 +140,12 @@ def stats_map(d, state,
 
 	if not np.any(mask):
 		return
-	for j in range(m):
-		if l > 0:
-			for k in range(l):
-				backscatter_hist_tmp[:,j,k] += np.histogram(
-					d['backscatter'][filter_mask[:,k] & mask,j,k],
-					bins=state['backscatter_half'])[0]
-		else:
-			backscatter_hist_tmp[:,j] += np.histogram(
-				d['backscatter'][filter_mask & mask,j],
-				bins=state['backscatter_half'])[0]
+	sel = filter_mask & (mask[:,np.newaxis] if l > 0 else mask)
+	backscatter_hist_tmp += kernels.histogram_levels(
+		d['backscatter'],
+		sel,
+		state['backscatter_half'],
+	)
 
 	jsd = np.argmin(np.abs(d['zfull'] - bsd_z))
 	state['backscatter_sd_z'] = d['zfull'][jsd]
@@ -141,75 +161,37 @@ def stats_map(d, state,
 				d['backscatter_sd'][filter_mask & mask,jsd],
 				bins=state['backscatter_sd_half'])[0]
 
-	for i in range(o):
-		if l > 0:
-			for k in range(l):
-				state['backscatter_hist'][i,:,k] += interp(
-					zhalf,
-					backscatter_hist_tmp[i,:,k],
-					zhalf2
-				)
-		else:
-			state['backscatter_hist'][i,:] += interp(
-				zhalf,
-				backscatter_hist_tmp[i,:],
-				zhalf2
-			)
-	for i in range(n):
-		if not mask[i]:
-			continue
-		if l > 0:
-			for k in range(l):
-				if not filter_mask[i,k]:
-					continue
-				cl_tmp[:,k] += d['cloud_mask'][i,:,k]
-				backscatter_avg_tmp[:,k] += d['backscatter'][i,:,k]
-				if 'backscatter_mol' in d:
-					backscatter_mol_avg_tmp[:,k] += d['backscatter_mol'][i,:]
-				state['n'][k] += 1
-				state['clt'][k] += np.any(d['cloud_mask'][i,:,k])
-		else:
-			if not filter_mask[i]:
-				continue
-			cl_tmp[:] += d['cloud_mask'][i,:]
-			backscatter_avg_tmp[:] += d['backscatter'][i,:]
-			if 'backscatter_mol' in d:
-				backscatter_mol_avg_tmp[:] += d['backscatter_mol'][i,:]
-			state['n'] += 1
-			state['clt'] += np.any(d['cloud_mask'][i,:])
-	if l > 0:
-		for k in range(l):
-			state['cl'][:,k] += interp(
-				zhalf,
-				cl_tmp[:,k],
-				zhalf2
-			)
-			state['backscatter_avg'][:,k] += interp(
-				zhalf,
-				backscatter_avg_tmp[:,k],
-				zhalf2
-			)
-			state['backscatter_mol_avg'][:,k] += interp(
-				zhalf,
-				backscatter_mol_avg_tmp[:,k],
-				zhalf2
-			)
-	else:
-		state['cl'] += interp(
-			zhalf,
-			cl_tmp,
-			zhalf2
-		)
-		state['backscatter_avg'] += interp(
-			zhalf,
-			backscatter_avg_tmp,
-			zhalf2
-		)
-		state['backscatter_mol_avg'] += interp(
-			zhalf,
-			backscatter_mol_avg_tmp,
-			zhalf2
-		)
+	state['backscatter_hist'] += interp_batch(
+		zhalf,
+		backscatter_hist_tmp,
+		zhalf2
+	)
+	cl1, b1, bmol1, n1, clt1 = kernels.profile_sums(
+		d['cloud_mask'],
+		d['backscatter'],
+		d.get('backscatter_mol'),
+		sel,
+	)
+	cl_tmp += cl1
+	backscatter_avg_tmp += b1
+	backscatter_mol_avg_tmp += bmol1
+	state['n'] += n1
+	state['clt'] += clt1
+	state['cl'] += interp_batch(
+		zhalf,
+		cl_tmp[np.newaxis,...],
+		zhalf2
+	)[0]
+	state['backscatter_avg'] += interp_batch(
+		zhalf,
+		backscatter_avg_tmp[np.newaxis,...],
+		zhalf2
+	)[0]
+	state['backscatter_mol_avg'] += interp_batch(
+		zhalf,
+		backscatter_mol_avg_tmp[np.newaxis,...],
+		zhalf2
+	)[0]
 
 def stats_reduce(state, bsd_z=None, **kwargs):
 	if len(state['cl'].shape) == 2:
@@ -228,6 +210,7 @@ def stats_reduce(state, bsd_z=None, **kwargs):
 			state['backscatter_avg'] /= state['n']
 			state['backscatter_mol_avg'] /= state['n']
 	state['backscatter_sd_hist'] /= state['n']
+	column = state.get('column', 'column')
 	do = {
 		'cl': 100.*state['cl'],
 		'clt': 100.*state['clt'],
@@ -249,7 +232,7 @@ def stats_reduce(state, bsd_z=None, **kwargs):
 			'units': 'm',
 		},
 		'cl': {
-			'.dims': ['zfull', 'column'] \
+			'.dims': ['zfull', column] \
 				if len(state['cl'].shape) == 2 \
 				else ['zfull'],
 			'long_name': 'cloud area fraction',
@@ -257,7 +240,7 @@ def stats_reduce(state, bsd_z=None, **kwargs):
 			'units': '%',
 		},
 		'clt': {
-			'.dims': ['column'] \
+			'.dims': [column] \
 				if isinstance(state['clt'], np.ndarray) \
 				else [],
 			'long_name': 'total cloud fraction',
@@ -265,21 +248,21 @@ def stats_reduce(state, bsd_z=None, **kwargs):
 			'units': '%',
 		},
 		'n': {
-			'.dims': ['column'] \
+			'.dims': [column] \
 				if len(state['cl'].shape) == 2 \
 				else [],
 			'long_name': 'number of profiles',
 			'units': '1',
 		},
 		'backscatter_avg': {
-			'.dims': ['zfull', 'column'] \
+			'.dims': ['zfull', column] \
 				if len(state['cl'].shape) == 2 \
 				else ['zfull'],
 			'long_name': 'total attenuated volume backscattering coefficient average',
 			'units': 'm-1 sr-1',
 		},
 		'backscatter_mol_avg': {
-			'.dims': ['zfull', 'column'] \
+			'.dims': ['zfull', column] \
 				if len(state['cl'].shape) == 2 \
 				else ['zfull'],
 			'long_name': 'total attenuated molecular volume backscattering coefficient average',
@@ -293,7 +276,7 @@ def stats_reduce(state, bsd_z=None, **kwargs):
 		'backscatter_hist': {
 			'.dims': ['backscatter_full', 'zfull'] \
 				if len(state['backscatter_hist'].shape) == 2 \
-				else ['backscatter_full', 'zfull', 'column'],
+				else ['backscatter_full', 'zfull', column],
 			'long_name': 'total attenuated volume backscattering coefficient histogram',
 			'units': '%',
 		},
@@ -301,7 +284,7 @@ def stats_reduce(state, bsd_z=None, **kwargs):
 			'.dims': ['backscatter_sd_full'],
 			'.dims': ['backscatter_sd_full'] \
 				if len(state['backscatter_sd_hist'].shape) == 1 \
-				else ['backscatter_sd_full', 'column'],
+				else ['backscatter_sd_full', column],
 			'long_name': 'total attenuated volume backscattering coefficient standard deviation histogram',
 			'units': '%',
 		},
@@ -316,6 +299,9 @@ def stats_reduce(state, bsd_z=None, **kwargs):
 			'units': 'm',
 		}
 	}
+	for var, (x, meta) in state.get('thresholds', {}).items():
+		do[var] = x
+		do['.'][var] = meta
 	return do
 
 def stream(dd, state, **options):
@@ -1,38 +1,221 @@
-import copy
 import numpy as np
-from alcf import misc
 import ds_format as ds
-import aquarius_time as aq
-
-def tsample(d, tres):
-	w = d['time_bnds'][:,1] - d['time_bnds'][:,0]
-	d['time_bnds'] = np.array([[
-		np.amin(d['time_bnds'][:,0]),
-		np.amax(d['time_bnds'][:,1])
-	]])
-	d['time'] = np.array([np.mean(d['time_bnds'], axis=1)])
-	if 'backscatter_sd' in d:
-		n, m = d['backscatter_sd'].shape
-		d['backscatter_sd'] = np.sqrt(1./n*np.average(
-			d['backscatter_sd']**2,
-			axis=0,
-			weights=w,
-		))
-		d['backscatter_sd'] = d['backscatter_sd'].reshape([1, m])
+from alcf import misc
+
+def bins(time_bnds, period, epsilon):
+	"""Find overlaps of time intervals with time bins of length period
+
+	time_bnds, period and epsilon are in units of misc.time_units. Returns an
+	array of interval indices, an array of bin indices and an array of
+	overlap lengths of all pairs of an interval and a bin which overlap,
+	sorted by bin. As in misc.aggregate, an interval extending past the end
+	of a bin is not counted in the bin if it starts less than epsilon before
+	its end.
+	"""
+	n = len(time_bnds)
+	kb = misc.time_bins(time_bnds, period)
+	k1 = kb[:,0]
+	k2 = kb[:,1] + 1
+	count = np.maximum(k2 - k1, 0)
+	ii = np.repeat(np.arange(n), count)
+	kk = np.repeat(k1 - np.cumsum(count) + count, count) + np.arange(len(ii))
+	t1 = kk*period
+	t2 = t1 + period
+	start = time_bnds[ii,0]
+	end = time_bnds[ii,1]
+	w = np.minimum(end, t2) - np.maximum(start, t1)
+	mask = (w > 0) & ~((end >= t2) & (t2 - start <= epsilon))
+	ii, kk, w = ii[mask], kk[mask], w[mask]
+	order = np.argsort(kk, kind='stable')
+	return ii[order], kk[order], w[order]
+
+def accumulate(d, tres, epsilon=1./86400.):
+	_, time_bnds, [p, eps], unit = misc.time_units(d, [tres, epsilon])
+	ii, kk, w = bins(time_bnds, p, eps)
+	if len(ii) == 0:
+		return None
+	idx = np.flatnonzero(np.diff(kk, prepend=kk[0] - 1))
+	acc = {
+		'd': {
+			var: d[var]
+			for var in ds.get_vars(d) + ['.']
+			if var == '.' or 'time' not in d['.'][var]['.dims']
+		},
+		'period': p,
+		'unit': unit,
+		'dtype': {},
+		'k': kk[idx],
+		'w': np.add.reduceat(w, idx),
+		'n': np.diff(np.append(idx, len(kk))),
+		'start': np.minimum.reduceat(
+			np.maximum(time_bnds[ii,0], kk*p), idx),
+		'end': np.maximum.reduceat(
+			np.minimum(time_bnds[ii,1], (kk + 1)*p), idx),
+		'vars': {},
+		'wv': {},
+		'nv': {},
+	}
 	for var in ds.get_vars(d):
-		if var in ('time', 'time_bnds', 'backscatter_sd'):
+		if var in ('time', 'time_bnds', 'time_ticks', 'time_bnds_ticks'):
 			continue
 		if 'time' not in d['.'][var]['.dims']:
 			continue
 		i = d['.'][var]['.dims'].index('time')
-		shape = list(d[var].shape)
-		d[var] = np.average(d[var], axis=i, weights=w)
-		shape[i] = 1
-		d[var] = d[var].reshape(shape)
+		x = np.moveaxis(d[var], i, 0)[ii]
+		if var == 'backscatter_sd':
+			x = x**2
+		wx = w.reshape([len(w)] + [1]*(x.ndim - 1))
+		if np.ma.is_masked(x):
+			# Masked values are excluded by zero weight. The sums of the
+			# weights and the number of the valid values are kept for
+			# every element.
+			valid = ~np.ma.getmaskarray(x)
+			wx = wx*valid
+			acc['wv'][var] = np.add.reduceat(wx, idx, axis=0)
+			acc['nv'][var] = np.add.reduceat(valid.astype(np.int64), idx,
+				axis=0)
+			x = np.ma.filled(x, 0)
+		acc['vars'][var] = np.add.reduceat(np.ma.getdata(x)*wx, idx, axis=0)
+		acc['dtype'][var] = d[var].dtype
+	return acc
 
-def stream(dd, state, tres=None, tlim=None, **options):
-	if tres is not None:
-		state['aggregate_state'] = state.get('aggregate_state', {})
-		dd = misc.aggregate(dd, state['aggregate_state'], tres)
-		return misc.stream(dd, state, tsample, tres=tres)
+def select(acc, sel):
+	return {
+		'd': acc['d'],
+		'period': acc['period'],
+		'unit': acc['unit'],
+		'dtype': acc['dtype'],
+		'k': acc['k'][sel],
+		'w': acc['w'][sel],
+		'n': acc['n'][sel],
+		'start': acc['start'][sel],
+		'end': acc['end'][sel],
+		'vars': {k: v[sel] for k, v in acc['vars'].items()},
+		'wv': {k: v[sel] for k, v in acc['wv'].items()},
+		'nv': {k: v[sel] for k, v in acc['nv'].items()},
+	}
+
+def valid(acc, var, key):
+	"""Get the sums of the weights (key wv) or the numbers (key nv) of the
+	valid values of var in accumulator acc. They are created from the weights
+	or the numbers of all profiles if var has no masked values."""
+	if var not in acc[key]:
+		x = acc['vars'][var]
+		a = acc['w' if key == 'wv' else 'n']
+		a = a.reshape([len(a)] + [1]*(x.ndim - 1))
+		acc[key][var] = np.broadcast_to(a, x.shape).copy()
+	return acc[key][var]
+
+def combine(acc1, acc2):
+	"""Add accumulator of a single bin acc1 to the first bin of acc2"""
+	for var, x in acc2['vars'].items():
+		if var not in acc1['vars']:
+			continue
+		x[0] += acc1['vars'][var][0]
+		for key in ['wv', 'nv']:
+			if var in acc1[key] or var in acc2[key]:
+				valid(acc2, var, key)[0] += valid(acc1, var, key)[0]
+	acc2['w'][0] += acc1['w'][0]
+	acc2['n'][0] += acc1['n'][0]
+	acc2['start'][0] = min(acc1['start'][0], acc2['start'][0])
+	acc2['end'][0] = max(acc1['end'][0], acc2['end'][0])
+
+def finalize(acc):
+	d = acc['d']
+	n = len(acc['k'])
+	dx = dict(d)
+	misc.set_time_bnds(dx,
+		np.stack([acc['start'], acc['end']], axis=1),
+		acc['unit'],
+		0.5*(acc['start'] + acc['end']),
+	)
+	for var, x in acc['vars'].items():
+		w = acc['wv'].get(var, acc['w'].reshape([n] + [1]*(x.ndim - 1)))
+		# Elements without valid values are NaN.
+		with np.errstate(divide='ignore', invalid='ignore'):
+			x = x/w
+		if var == 'backscatter_sd':
+			nn = acc['nv'].get(var, acc['n'].reshape([n] + [1]*(x.ndim - 1)))
+			with np.errstate(divide='ignore', invalid='ignore'):
+				x = np.sqrt(1./nn*x)
+		if np.issubdtype(acc['dtype'][var], np.floating):
+			x = x.astype(acc['dtype'][var], copy=False)
+		i = d['.'][var]['.dims'].index('time')
+		dx[var] = np.moveaxis(x, 0, i)
+	return dx
+
+def is_identity(d, tres, epsilon=1e-3/86400.):
+	"""Check if dataset d is already resampled to time bins of length tres,
+	i.e. every profile covers exactly one bin, in ascending order of bins, and
+	is centered in the bin (within epsilon)"""
+	if len(d['time']) == 0:
+		return True
+	time, time_bnds, [p], unit = misc.time_units(d, [tres])
+	eps = epsilon*unit
+	k = np.round(time_bnds[:,0]/p)
+	t1 = k*p
+	return bool(
+		np.all(np.abs(time_bnds[:,0] - t1) < eps) and
+		np.all(np.abs(time_bnds[:,1] - (t1 + p)) < eps) and
+		np.all(np.abs(time - (t1 + 0.5*p)) < eps) and
+		np.all(np.diff(k) > 0)
+	)
+
+def fill(d):
+	"""Replace masked values in time-dependent variables of dataset d with
+	NaN, as in resampled datasets"""
+	for var in ds.get_vars(d):
+		x = d[var]
+		if not isinstance(x, np.ma.MaskedArray) or \
+			'time' not in d['.'][var]['.dims']:
+			continue
+		if not np.issubdtype(x.dtype, np.floating):
+			x = x.astype(np.float64)
+		d[var] = np.ma.filled(x, np.nan)
+
+def tsample(d, state, tres):
+	"""Resample dataset d to time bins of length tres
+
+	Returns a list of datasets of complete bins. The last bin is kept in
+	state until a following bin is encountered or the stream ends.
+	"""
+	if len(d['time']) == 0:
+		return []
+	dd = []
+	carry = state.get('carry')
+	# A dataset already resampled to the bins is passed unchanged if it does
+	# not continue the last bin.
+	_, time_bnds, [p], _ = misc.time_units(d, [tres])
+	if is_identity(d, tres) and (carry is None or
+		carry['k'][0] < np.round(time_bnds[0,0]/p)):
+		if carry is not None:
+			dd += [finalize(carry)]
+			state['carry'] = None
+		fill(d)
+		return dd + [d]
+	acc = accumulate(d, tres)
+	if acc is None:
+		return []
+	if carry is not None:
+		if carry['k'][0] == acc['k'][0]:
+			combine(carry, acc)
+		else:
+			dd += [finalize(carry)]
+	if len(acc['k']) > 1:
+		dd += [finalize(select(acc, slice(None, -1)))]
+	state['carry'] = select(acc, slice(-1, None))
 	return dd
+
+def stream(dd, state, tres=None, tlim=None, **options):
+	if tres is None:
+		return dd
+	ddo = []
+	for d in dd:
+		if d is None:
+			if state.get('carry') is not None:
+				ddo += [finalize(state['carry'])]
+				state['carry'] = None
+			ddo += [None]
+			break
+		ddo += tsample(d, state, tres)
+	return ddo
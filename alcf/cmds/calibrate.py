@@ -3,6 +3,7 @@ import ds_format as ds
 import numpy as np
 import aquarius_time as aq
 from alcf.lidars import LIDARS
+from alcf import misc
 
 def read_time_periods(filename):
 	tp = []
@@ -74,10 +75,7 @@ Read time periods from `time_periods.txt`, lidar profiles from the directory
 		filename = os.path.join(input_, file_)
 		print('<- %s' % filename)
 		d = ds.read(filename, ['time'])
-		mask = np.zeros(len(d['time']), dtype=np.bool)
-		for period in tp:
-			mask |= (d['time'] >= period[0]) & \
-				(d['time'] < period[1])
+		mask = misc.time_within(d['time'], tp)
 		d = ds.read(filename, ['lr'], {'time': mask})
 		lr.append(d['lr'])
 	lr = np.hstack(lr)
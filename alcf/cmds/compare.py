@@ -15,6 +15,7 @@ def read(d):
 	print('<- %s' % d['filename'])
 	if d is not None:
 		d0 = ds.read(d['filename'], VARIABLES)
+		misc.unpack_cloud_mask(d0)
 		d.update(d0)
 
 def read_stream(dd, state):
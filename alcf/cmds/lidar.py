@@ -1,7 +1,6 @@
 import os
 import logging
 import traceback
-import numpy as np
 import ds_format as ds
 import aquarius_time as aq
 from alcf.lidars import LIDARS
@@ -9,8 +8,11 @@ from alcf.algorithms.calibration import CALIBRATION
 from alcf.algorithms.noise_removal import NOISE_REMOVAL
 from alcf.algorithms.cloud_detection import CLOUD_DETECTION
 from alcf.algorithms.cloud_base_detection import CLOUD_BASE_DETECTION
-from alcf.algorithms import tsample, zsample, output_sample, lidar_ratio
+from alcf.algorithms import tsample, zsample, output_sample, \
+	lidar_ratio
 from alcf.algorithms import couple as couple_mod
+from alcf.algorithms import cache as cache_mod
+from alcf.algorithms import molecular
 from alcf import misc
 import pst
 
@@ -43,6 +45,7 @@ def run(type_, input_, output,
 	noise_removal='default',
 	calibration='default',
 	output_sampling=86400,
+	skip_empty=False,
 	overlap_file=None,
 	calibration_file=None,
 	couple=None,
@@ -50,6 +53,15 @@ def run(type_, input_, output,
 	cl_crit_range=6000,
 	lat=None,
 	lon=None,
+	profile=None,
+	precision='float64',
+	cloud_mask_storage='byte',
+	products=None,
+	cache=None,
+	bmol=None,
+	surface_pressure=None,
+	surface_temperature=None,
+	explain=False,
 	**options
 ):
 	"""
@@ -61,6 +73,7 @@ The processing is done in the following order:
 - calibration
 - time resampling
 - height resampling
+- molecular backscatter calculation
 - cloud detection
 - cloud base detection
 
@@ -89,15 +102,48 @@ Options:
 
 - `altitude`: Altitude of the instrument (m).
     Default: Taken from lidar data or `0` if not available.
+- `bmol: <source>`: Source of molecular backscatter if it is not available
+    in the lidar data or from `couple`: `standard` to calculate it at the
+    lidar wavelength in the U.S. Standard Atmosphere 1976 (optionally
+    adjusted by `surface_pressure` and `surface_temperature`). Molecular
+    backscatter is calculated once for every height grid and instrument
+    altitude and subtracted from backscatter in cloud detection. Default:
+    `none`.
+- `cache: <directory>`: Cache the output of reading, coupling, noise
+    removal and calibration (before resampling) in a directory. The cache
+    is keyed by a hash of the contents of the input files and the options
+    which affect these stages (`altitude`, `calibration`,
+    `calibration_file`, `cl_crit_range`, `couple`, `fix_cl_range`, `lat`,
+    `lon`, `noise_removal`, `noise_removal_sampling`, `precision`, `tlim`,
+    `tshift` and the lidar type). Files in the `couple` directory are compared by
+    name, size and modification time. A later run with the same key reads
+    the cache instead of the input files and skips these stages, e.g. when
+    only `cloud_threshold`, `tres` or `zres` are changed. Every key is
+    stored in a subdirectory, which is only used if it was written
+    completely. The index of time in the files in the `couple` directory is
+    also stored in the cache directory, and time is read again only from
+    new or modified files. Default: `none`.
 - `calibration: <algorithm>`: Backscatter calibration algorithm.
     Available algorithms: `default`, `none`. Default: `default`.
 - `couple: <directory>`: Couple to other lidar data. Default: `none`.
+- `--explain`: Print the processing plan and exit without processing. The
+    plan is the list of processing stages determined from the options and the
+    first input file. Stages which would not change the data are left out
+    (calibration with a calibration coefficient of 1). Height and time
+    resampling are marked as skipped if the first input file is already on
+    the target height grid or in the target time bins. Whether resampling is
+    skipped is still decided for every input file separately.
 - `cl_crit_range: <range>`: Critical range for the `fix_cl_range` option (m).
     Default: 6000.
 - `cloud_detection: <algorithm>`: Cloud detection algorithm.
     Available algorithms: `default`, `none`. Default: `default`.
 - `cloud_base_detection: <algorithm>`: Cloud base detection algorithm.
     Available algorithms: `default`, `none`. Default: `default`.
+- `cloud_mask_storage: <storage>`: Storage of the cloud mask in the output:
+    `byte` for one byte per level or `bit` for one bit per level (packed
+    along the level axis into bytes of a dimension `level_bits`). The bit
+    storage is unpacked transparently when reading the output with `alcf
+    lidar default`, `alcf stats` and `alcf plot`. Default: `byte`.
 - `fix_cl_range` (experimental): Fix CL31/CL51 range correction (if `noise_h2`
 	firmware option if off). The critical range is taken from `cl_crit_range`.
 - `lat: <lat>`: Latitude of the instrument (degrees North).
@@ -108,7 +154,40 @@ Options:
     Available algorithms: `default`, `none`.  Default: `default`.
 - `output_sampling: <period>`: Output sampling period (seconds).
     Default: `86400` (24 hours).
-- `tlim: { <low> <high> }`: Time limits (see Time format below).
+- `precision: <precision>`: Floating point precision of processing and
+    output (`float32` or `float64`). Time and time bounds are always
+    `float64`, and time resampling accumulates in `float64`. Compared with
+    `float64` processing of the same input, `float32` backscatter differs by
+    less than about 1e-7 of the maximum backscatter (relative difference
+    about 1e-7 except for backscatter close to zero), and the cloud mask
+    can differ only where backscatter is within this difference from the
+    cloud detection threshold. Default: `float64`.
+- `products: { { <tres> <zres> <output> }... }`: Produce multiple outputs
+    at different time and height resolutions in a single pass. Every
+    product is a time resolution (seconds), a height resolution (m) and an
+    output directory (relative to `output`, created if it does not exist).
+    Reading, coupling, noise removal and calibration are done once for all
+    products. Resampling, output sampling, cloud detection, cloud base
+    detection and writing are done for every product separately. The
+    options `tres` and `zres` are ignored. The stages of the products are
+    reported in `profile` prefixed with the output directory.
+    Default: `none`.
+- `profile: <file>`: Write a JSON report of wall time, number of profiles
+    and bytes processed by every processing stage to a file.
+    Default: `none`.
+- `--skip_empty`: Store only time bins which contain data instead of all time
+    bins of the output sampling period. Output files are still named by the
+    start of the output sampling period.
+- `surface_pressure: <pressure>`: Pressure at the instrument altitude
+    used with `bmol: standard` (Pa). Default: `none` (standard atmosphere).
+- `surface_temperature: <temperature>`: Temperature at the instrument
+    altitude used with `bmol: standard` (K). The temperature profile of
+    the standard atmosphere is shifted to match it. Default: `none`
+    (standard atmosphere).
+- `tlim: { <low> <high> }`: Time limits (see Time format below). Only
+    profiles with time in the interval `[<low>, <high>)` (after the time
+    shift) are read. Files without such profiles are skipped after reading
+    only their time, and are not included in the `cache` key.
     Default: `none`.
 - `tres: <tres>`: Time resolution (seconds). Default: `300` (5 min).
 - `tshift: <tshift>`: Time shift (seconds). Default: `0`.
@@ -119,10 +198,20 @@ Algorithm options:
 
 - Cloud detection:
     - `default`: cloud detection based on backscatter threshold
-        - `cloud_nsd: <n>`: Number of noise standard deviations to subtract.
-            Default: `5`.
-        - `cloud_threshold: <threshold>`: Cloud detection threshold
-            (sr^-1.m^-1). Default: `2e-6`.
+        - `cloud_nsd: <n> | { <n>... }`: Number of noise standard deviations
+            to subtract. Default: `5`.
+        - `cloud_threshold: <threshold> | { <threshold>... }`: Cloud
+            detection threshold (sr^-1.m^-1). Default: `2e-6`.
+
+        If `cloud_nsd` or `cloud_threshold` is a list, clouds are detected
+        for every threshold in a single pass (threshold sweep). The lists
+        must be of the same length, or one of them a single value. The
+        cloud mask, cloud base height, cloud top height and number of cloud
+        layers have an additional dimension `threshold`, and the thresholds
+        are stored in the variables `cloud_threshold` and `cloud_nsd`. The
+        cloud mask of every threshold is the same as in a separate run with
+        the threshold. Threshold sweep is not supported for data with
+        columns (`cosp`).
 	- `none`: disable cloud detection
 
 - Cloud base detection:
@@ -137,8 +226,9 @@ Algorithm options:
 
 - Noise removal:
     - `default`:
-        - `noise_removal_sampling: <period>`: Sampling period for noise removal
-            (seconds). Default: 300.
+        - `noise_removal_sampling: <period>`: Length of the moving window
+            centered on every profile in which noise is estimated (seconds).
+            Default: 300.
     - `none`: disable noise removal
 	"""
 	# if time is not None:
@@ -148,6 +238,23 @@ Algorithm options:
 	if lidar is None:
 		raise ValueError('Invalid type: %s' % type_)
 
+	if precision not in ('float32', 'float64'):
+		raise ValueError('Invalid precision: %s' % precision)
+
+	if cloud_mask_storage not in ('byte', 'bit'):
+		raise ValueError('Invalid cloud mask storage: %s' % cloud_mask_storage)
+
+	if products is None:
+		products = [(tres, zres, output)]
+	else:
+		for product in products:
+			if not isinstance(product, list) or len(product) != 3:
+				raise ValueError('Invalid product: %s' % product)
+		products = [
+			(tres1, zres1, os.path.join(output, output1))
+			for tres1, zres1, output1 in products
+		]
+
 	noise_removal_mod = None
 	calibration_mod = None
 	cloud_detection_mod = None
@@ -167,12 +274,25 @@ Algorithm options:
 		cloud_detection_mod = CLOUD_DETECTION.get(cloud_detection)
 		if cloud_detection_mod is None:
 			raise ValueError('Invalid cloud detection algorithm: %s' % cloud_detection)
+		# Threshold sweep is rejected before processing, because it would
+		# fail for every dataset with columns.
+		if type_ == 'cosp' and any(
+			isinstance(options.get(x), list)
+			for x in ('cloud_threshold', 'cloud_nsd')
+		):
+			raise ValueError('Cloud detection threshold sweep is not supported for data with columns (cosp)')
 
 	if cloud_base_detection is not None:
 		cloud_base_detection_mod = CLOUD_BASE_DETECTION.get(cloud_base_detection)
 		if cloud_base_detection_mod is None:
 			raise ValueError('Invalid cloud base detection algorithm: %s' % cloud_base_detection)
 
+	if tlim is not None:
+		tlim = misc.parse_time(tlim)
+
+	if bmol not in (None, 'standard'):
+		raise ValueError('Invalid molecular backscatter source: %s' % bmol)
+
 	if calibration_file is not None:
 		c = read_calibration_file(calibration_file)
 		calibration_coeff = c[b'calibration_coeff']/lidar.CALIBRATION_COEFF
@@ -180,98 +300,215 @@ Algorithm options:
 		calibration_coeff = 1.
 
 	def write(d, output):
+		if len(d['time']) > 0 and output_sampling is not None:
+			# Start of the output sampling period.
+			_, time_bnds, [p], unit = misc.time_units(d,
+				[output_sampling/86400.])
+			t1 = (time_bnds[0,0] // p)*p/unit - 0.5
+		elif len(d['time']) > 0:
+			t1 = d['time_bnds'][0,0]
+		misc.rm_time_ticks(d)
+		if precision != 'float64':
+			misc.set_precision(d, precision)
+		if cloud_mask_storage == 'bit':
+			misc.pack_cloud_mask(d)
 		if len(d['time']) == 0:
 			return
-		t1 = d['time_bnds'][0,0]
-		t1 = np.round(t1*86400.)/86400.
 		filename = os.path.join(output, '%s.nc' % aq.to_iso(t1).replace(':', ''))
 		ds.write(filename, d)
 		print('-> %s' % filename)
 		return []
 
-	def output_stream(dd, state, output_sampling=None, **options):
-		# if output_sampling is not None:
-		# 	state['aggregate_state'] = state.get('aggregate_state', {})
-		# 	dd = misc.aggregate(dd, state['aggregate_state'],
-		# 		output_sampling/60./60./24.
-		# 	)
-		return misc.stream(dd, state, write, output=output)
-
 	def preprocess(d, tshift=None):
 		if tshift is not None:
 			d['time'] += tshift/86400.
 			d['time_bnds'] += tshift/86400.
+		# Time is binned in integer ticks until written.
+		misc.set_time_ticks(d)
+		if precision != 'float64':
+			misc.set_precision(d, precision)
 		return d
 
-	def process(dd, state, **options):
-		state['preprocess'] = state.get('preprocess', {})
-		state['noise_removal'] = state.get('noise_removal', {})
-		state['calibration'] = state.get('calibration', {})
-		state['tsample'] = state.get('tsample', {})
-		state['zsample'] = state.get('zsample', {})
-		state['output_sample'] = state.get('output_sample', {})
-		state['cloud_detection'] = state.get('cloud_detection', {})
-		state['cloud_base_detection'] = state.get('cloud_base_detection', {})
-		state['lidar_ratio'] = state.get('lidar_ratio', {})
-		state['output'] = state.get('output', {})
-		state['couple'] = state.get('couple', {})
-		dd = misc.stream(dd, state['preprocess'], preprocess, tshift=tshift)
-		if couple is not None:
-			dd = couple_mod.stream(dd, state['couple'], couple)
-		if noise_removal_mod is not None:
-			dd = noise_removal_mod.stream(dd, state['noise_removal'], **options)
-		if calibration_mod is not None:
-			dd = calibration_mod.stream(dd, state['calibration'], **options)
-		if zres is not None or zlim is not None:
-			dd = zsample.stream(dd, state['zsample'], zres=zres, zlim=zlim)
-		if tres is not None or tlim is not None:
-			dd = tsample.stream(dd, state['tsample'], tres=tres/86400., tlim=tlim)
-		if output_sampling is not None:
-			dd = output_sample.stream(dd, state['output_sample'],
-				tres=tres/86400.,
-				output_sampling=output_sampling/86400.,
-			)
-			dd = misc.aggregate(dd, state['output_sample'], output_sampling/86400.)
-		if cloud_detection_mod is not None:
-			dd = cloud_detection_mod.stream(dd, state['cloud_detection'], **options)
-		if cloud_base_detection_mod is not None:
-			dd = cloud_base_detection_mod.stream(dd, state['cloud_base_detection'], **options)
-		dd = lidar_ratio.stream(dd, state['lidar_ratio'])
-		dd = output_stream(dd, state['output']) #, output_sampling=output_sampling)
-		return dd
-
-	options['output'] = output
-	options['calibration_coeff'] = calibration_coeff
-
-	state = {}
-	if os.path.isdir(input_):
-		files = sorted(os.listdir(input_))
-		for file_ in files:
-			input_filename = os.path.join(input_, file_)
-			print('<- %s' % input_filename)
+	def read(filenames, warn=False):
+		for filename in filenames:
+			print('<- %s' % filename)
 			try:
-				d = lidar.read(input_filename, VARIABLES,
+				d = lidar.read(filename, VARIABLES,
 					altitude=altitude,
 					lon=lon,
 					lat=lat,
 					fix_cl_range=fix_cl_range,
 					cl_crit_range=cl_crit_range,
+					tlim=tlim_read,
+					time=times.pop(filename, None),
 				)
-				dd = process([d], state, **options)
-			except SystemExit:
-				raise
-			except SystemError:
-				raise
-			except:
+				if d is not None:
+					yield d
+			except Exception:
+				if not warn:
+					raise
 				logging.warning(traceback.format_exc())
-		dd = process([None], state, **options)
+
+	def scan(filename):
+		"""Check if a file contains profiles within the time limits by
+		reading only time. Time is kept in times to be reused when reading.
+		Files which cannot be read are kept so that the error is reported
+		when reading."""
+		try:
+			time = lidar.read_time(filename)
+		except Exception:
+			return True
+		if len(misc.time_sel(*time, tlim=tlim_read)[0]) == 0:
+			return False
+		times[filename] = time
+		return True
+
+	options['output'] = output
+	options['calibration_coeff'] = calibration_coeff
+
+	if os.path.isdir(input_):
+		filenames = [
+			os.path.join(input_, file_)
+			for file_ in sorted(os.listdir(input_))
+		]
+		warn = True
+	else:
+		filenames = [input_]
+		warn = False
+
+	times = {}
+	if tlim is not None:
+		# Time limits of the input before the time shift.
+		tlim_read = [t - tshift/86400. for t in tlim]
+		filenames = [x for x in filenames if scan(x)]
+	else:
+		tlim_read = None
+
+	prof = {} if profile is not None else None
+	stages = [(misc.stream, {'f': preprocess, 'tshift': tshift})]
+	if couple is not None:
+		stages += [(couple_mod.stream, {
+			'dirname': couple,
+			'index_file': cache_mod.index_file(cache, couple) \
+				if cache is not None else None,
+		})]
+	if noise_removal_mod is not None:
+		stages += [(noise_removal_mod.stream, options)]
+	if calibration_mod is not None and calibration_coeff != 1.:
+		stages += [(calibration_mod.stream, options)]
+
+	cached = False
+	if cache is not None:
+		cache_dir = os.path.join(cache, cache_mod.key(filenames, {
+			'type': type_,
+			'altitude': altitude,
+			'lon': lon,
+			'lat': lat,
+			'fix_cl_range': fix_cl_range,
+			'cl_crit_range': cl_crit_range,
+			'tshift': tshift,
+			'tlim': tlim,
+			'precision': precision,
+			'couple': couple,
+			'noise_removal': noise_removal \
+				if noise_removal_mod is not None else None,
+			'noise_removal_sampling': options.get('noise_removal_sampling') \
+				if noise_removal_mod is not None else None,
+			'calibration': calibration \
+				if calibration_mod is not None else None,
+			'calibration_coeff': calibration_coeff,
+		}, [couple] if couple is not None else []))
+		cached = cache_mod.complete(cache_dir)
+		if cached:
+			# The cached datasets are already processed by the stages.
+			stages = []
+		else:
+			stages += [(cache_mod.stream, {'dirname': cache_dir})]
+	input_dd = cache_mod.read(cache_dir) if cached else read(filenames, warn)
+
+	def product_stages(tres, zres, output):
+		stages = []
+		if zres is not None or zlim is not None:
+			stages += [(zsample.stream, {'zres': zres, 'zlim': zlim})]
+		if tres is not None:
+			stages += [(tsample.stream, {'tres': tres/86400., 'tlim': tlim})]
+		if output_sampling is not None:
+			stages += [(output_sample.stream, {
+				'tres': tres/86400.,
+				'output_sampling': output_sampling/86400.,
+				'skip_empty': skip_empty,
+			})]
+		if bmol == 'standard':
+			stages += [(molecular.stream, {
+				'wavelength': lidar.WAVELENGTH,
+				'surface_pressure': surface_pressure,
+				'surface_temperature': surface_temperature,
+				'surface_lidar': lidar.SURFACE_LIDAR is not False,
+			})]
+		if cloud_detection_mod is not None:
+			stages += [(cloud_detection_mod.stream, options)]
+		if cloud_base_detection_mod is not None:
+			stages += [(cloud_base_detection_mod.stream, options)]
+		stages += [
+			(lidar_ratio.stream, {}),
+			(misc.stream, {'f': write, 'output': output}),
+		]
+		return stages
+
+	if len(products) == 1:
+		stages += product_stages(*products[0])
 	else:
-		print('<- %s' % input_)
-		d = lidar.read(input_, VARIABLES,
-			altitude=altitude,
-			lon=lon,
-			lat=lat,
-			fix_cl_range=fix_cl_range,
-			cl_crit_range=cl_crit_range,
-		)
-		dd = process([d, None], state, **options)
+		stages += [(misc.branch, {
+			'branches': [
+				(product[2], product_stages(*product))
+				for product in products
+			],
+			'warn': warn,
+			'profile': prof,
+		})]
+
+	if explain:
+		d0 = next(input_dd, None)
+		if cached:
+			# Time shift is already applied to cached datasets.
+			tshift = 0.
+
+		def explain_stages(stages, tres, zres, indent=''):
+			notes = {}
+			if d0 is not None and zres is not None and zlim is not None and \
+				zsample.is_identity(d0, zres, zlim):
+				notes[zsample.stream] = 'skipped (input is on the height grid)'
+			if d0 is not None and tres is not None and tsample.is_identity({
+				'time': d0['time'] + tshift/86400.,
+				'time_bnds': d0['time_bnds'] + tshift/86400.,
+			}, tres/86400.):
+				notes[tsample.stream] = 'skipped (input is in the time bins)'
+			for f, opts in stages:
+				if f is misc.branch:
+					for (name, stages1), product in zip(opts['branches'], products):
+						print('%s- %s:' % (indent, name))
+						explain_stages(stages1, product[0], product[1],
+							indent + '    ')
+					continue
+				name = misc.stage_name(f, opts)
+				if f in notes:
+					name += ': ' + notes[f]
+				print('%s- %s' % (indent, name))
+
+		print('Processing plan:')
+		if cached:
+			print('- read cache %s' % cache_dir)
+		explain_stages(stages, *products[0][:2])
+		return
+
+	for _, _, output1 in products:
+		if output1 != output:
+			os.makedirs(output1, exist_ok=True)
+
+	for d in misc.pipeline(input_dd, stages,
+		warn=warn,
+		profile=prof,
+	):
+		pass
+	if profile is not None:
+		misc.write_profile(profile, prof)
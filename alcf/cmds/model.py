@@ -1,21 +1,25 @@
 import sys
 import os
+import time as time_mod
 import numpy as np
 import aquarius_time as aq
 import ds_format as ds
 from alcf.models import MODELS
+from alcf import misc
 
-def get_track_segment(track, t1, t2):
-	mask = (track['time'] >= t1) & (track['time'] < t2)
-	n = np.sum(mask)
+def get_track_segment(track, t1, t2, index=None):
+	if index is None:
+		index = misc.time_index(track['time'])
+	ii = misc.time_range(index, t1, t2)
+	n = len(ii)
 	lon1, lon2 = np.interp([t1, t2], track['time'], track['lon'])
 	lat1, lat2 = np.interp([t1, t2], track['time'], track['lat'])
 	time = np.full(n + 2, np.nan, np.float64)
 	lon = np.full(n + 2, np.nan, np.float64)
 	lat = np.full(n + 2, np.nan, np.float64)
-	time[1:-1] = track['time'][mask]
-	lon[1:-1] = track['lon'][mask]
-	lat[1:-1] = track['lat'][mask]
+	time[1:-1] = track['time'][ii]
+	lon[1:-1] = track['lon'][ii]
+	lat[1:-1] = track['lat'][ii]
 	time[0], time[-1] = t1, t2
 	lon[0], lon[-1] = lon1, lon2
 	lat[0], lat[-1] = lat1, lat2
@@ -26,13 +30,15 @@ def get_track_segment(track, t1, t2):
 		'.': track['.']
 	}
 
-def model(type_, input_, point=None, time=None, track=None):
+def model(type_, input_, point=None, time=None, track=None,
+	track_index=None):
 	model = MODELS.get(type_)
 	warnings = []
 	if model is None:
 		raise ValueError('Invalid type: %s' % type_)
 	if track is not None:
-		track_segment = get_track_segment(track, time[0], time[1])
+		track_segment = get_track_segment(track, time[0], time[1],
+			index=track_index)
 		d = model.read(input_, track_segment, warnings=warnings)
 	else:
 		lon = np.array([point[0], point[0]], dtype=np.float64)
@@ -54,6 +60,7 @@ def run(type_, input_, output,
 	track=None,
 	track_override_year=None,
 	track_lon_180=False,
+	profile=None,
 	**kwargs
 ):
 	"""
@@ -82,6 +89,8 @@ Options:
 - `track_override_year: <year>`: Override year in track.
     Use if comparing observations with a model statistically. Default: `none`.
 - `--track_lon_180`: expect track longitude between -180 and 180 degrees
+- `profile: <file>`: Write a JSON report of wall time, number of profiles
+    and bytes processed by reading and writing to a file. Default: `none`.
 
 Types:
 
@@ -134,14 +143,26 @@ Track file is a NetCDF file containing 1D variables `lon`, `lat`, and `time`.
 					raise ValueError('Invalid time format: %s' % time[i])
 
 	# if os.path.isdir(output):
+	prof = {}
+	# Index of track time built once for all days.
+	track_index = misc.time_index(track1['time']) \
+		if track1 is not None else None
 	t1, t2 = time1[0], time1[1]
 	for t in np.arange(np.floor(t1 - 0.5), np.ceil(t2 - 0.5)) + 0.5:
 		output_filename = os.path.join(output, '%s.nc' % \
 			aq.to_iso(t).replace(':', ''))
-		d = model(type_, input_, point, time=[t, t + 1.], track=track1)
+		s = time_mod.time()
+		d = model(type_, input_, point, time=[t, t + 1.], track=track1,
+			track_index=track_index)
+		misc.profile_update(prof, 'alcf.models.%s.read' % type_,
+			time_mod.time() - s, dd_out=[d])
 		if d is not None:
+			s = time_mod.time()
 			ds.write(output_filename, d)
+			misc.profile_update(prof, 'output', time_mod.time() - s, dd_in=[d])
 			print('-> %s' % output_filename)
+	if profile is not None:
+		misc.write_profile(profile, prof)
 	# else:
 	# 	d = model(type_, input_, point, time=time1, track=track1)
 	# 	if d is not None:
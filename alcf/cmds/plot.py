@@ -16,6 +16,7 @@ import matplotlib.lines as mlines
 import aquarius_time as aq
 import ds_format as ds
 from alcf import misc, algorithms
+from alcf.algorithms import output_sample
 from alcf.lidars import LIDARS
 
 COLORS = [
@@ -49,6 +50,11 @@ VARIABLES = [
 	'cli',
 ]
 
+def read(filename):
+	d = ds.read(filename, VARIABLES)
+	misc.unpack_cloud_mask(d)
+	return d
+
 def plot_legend(*args, theme='light', **kwargs):
 	legend = plt.legend(*args, fontsize=8, **kwargs)
 	f = legend.get_frame()
@@ -76,15 +82,16 @@ def plot_profile(plot_type, d,
 		if vlog is None:
 			vlog = True
 		if len(d['backscatter'].shape) == 3:
-			b = d['backscatter'][:,:,subcolumn]
+			b = d['backscatter'][:,:,subcolumn].copy()
 			cloud_mask = d['cloud_mask'][:,:,subcolumn]
 			bsd = d['backscatter_sd'][:,:,subcolumn] if 'backscatter_sd' in d \
 				else np.zeros(b.shape, dtype=np.float64)
 		else:
-			b = d['backscatter']
+			b = d['backscatter'].copy()
 			cloud_mask = d['cloud_mask']
 			bsd = d['backscatter_sd'] if 'backscatter_sd' in d \
 				else np.zeros(b.shape, dtype=np.float64)
+		# b is a copy, so that the dataset is not modified below.
 		if sigma > 0:
 			b -= sigma*bsd
 		if remove_bmol and 'backscatter_mol' in d:
@@ -132,13 +139,7 @@ def plot_profile(plot_type, d,
 			zlim = [np.min(d['zfull']), np.max(d['zfull'])]
 		zhalf = np.arange(zlim[0], zlim[1] + zres, zres)
 		zfull = 0.5*(zhalf[1:] + zhalf[:-1])
-		xp = np.full((x.shape[0], len(zfull)), np.nan, np.float64)
-		for i in range(xp.shape[0]):
-			zhalfi = misc.half(d['zfull'][i,:])
-			xp[i,:] = algorithms.interp(
-				zhalfi, x[i,:], zhalf
-			)
-		x = xp
+		x = algorithms.interp_batch(misc.half(d['zfull']), x, zhalf)
 		time = d['time']
 	else:
 		raise ValueError('Invalid plot type "%s"' % plot_type)
@@ -356,6 +357,8 @@ def plot(plot_type, d, output,
 		fig = plt.figure(figsize=[width, height])
 
 	if plot_type == 'backscatter':
+		if 'time_bnds' in d:
+			output_sample.fill_empty(d)
 		if lr:
 			gs = GridSpec(2, 2,
 				width_ratios=[0.985, 0.015],
@@ -560,12 +563,12 @@ Plot command options:
 		dd = []
 		for file in input_:
 			print('<- %s' % file)
-			dd += [ds.read(file, VARIABLES)]
+			dd += [read(file)]
 		plot(plot_type, dd, output, **opts)
 		print('-> %s' % output)
 	elif plot_type == 'backscatter_hist':
 		print('<- %s' % input_[0])
-		d = ds.read(input_[0], VARIABLES)
+		d = read(input_[0])
 		plot(plot_type, d, output, **opts)
 		print('-> %s' % output)
 	elif plot_type in ('backscatter', 'clw', 'cli', 'clw+cli', 'cl'):
@@ -579,7 +582,7 @@ Plot command options:
 					)
 					try:
 						print('<- %s' % filename)
-						d = ds.read(filename, VARIABLES)
+						d = read(filename)
 					except SystemExit:
 						raise
 					except SystemError:
@@ -597,7 +600,7 @@ Plot command options:
 						logging.warning(traceback.format_exc())
 			else:
 				print('<- %s' % input1)
-				d = ds.read(input1, VARIABLES)
+				d = read(input1)
 				try:
 					plot(plot_type, d, output, **opts)
 				except SystemExit:
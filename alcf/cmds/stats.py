@@ -1,9 +1,12 @@
 import os
 import sys
+import time
 import numpy as np
 import ds_format as ds
 from alcf.algorithms import interp
 from alcf.algorithms import stats
+from alcf.algorithms.cloud_detection import default as cloud_detection
+from alcf import misc
 from alcf.misc import parse_time
 
 VARIABLES = [
@@ -15,6 +18,8 @@ VARIABLES = [
 	'backscatter_mol',
 	'lon',
 	'lat',
+	'cloud_threshold',
+	'cloud_nsd',
 ]
 
 def run(input_, output,
@@ -28,6 +33,10 @@ def run(input_, output,
 	filter=None,
 	zlim=[0., 15000.],
 	zres=100.,
+	profile=None,
+	precision='float64',
+	cloud_threshold=None,
+	cloud_nsd=None,
 	**kwargs
 ):
 	"""
@@ -46,6 +55,20 @@ Options:
     Default: `{ 5 200 }`.
 - `bres: <value>`: backscatter histogram resolution (1e-6 m-1.sr-1).
     Default: `10`.
+- `cloud_nsd: <n> | { <n>... }`: Detect clouds again with the `default`
+    cloud detection algorithm of `alcf lidar` with a number of noise
+    standard deviations to subtract (see `cloud_threshold`).
+    Default: `none`.
+- `cloud_threshold: <threshold> | { <threshold>... }`: Detect clouds
+    again with the `default` cloud detection algorithm of `alcf lidar` with
+    a cloud detection threshold (sr^-1.m^-1) instead of using the cloud mask
+    of the input. If `cloud_threshold` or `cloud_nsd` is a list, cloud
+    occurrence is calculated for every threshold in a single pass (see
+    threshold sweep in `alcf lidar`). The default of the other option is
+    taken from the cloud detection algorithm. Input containing a threshold
+    sweep produced by `alcf lidar` is processed in the same way. The
+    statistics have a dimension `threshold` instead of `column`.
+    Default: `none`.
 - `filter: <value> | { <value> ... }`: Filter profiles by condition: `cloudy` for
     cloudy profiles only, `clear` for clear sky profiles only, `night` for
     nighttime profiles, `day` for daytime profiles, `none` for all profiles.
@@ -54,6 +77,12 @@ Options:
     fields set via the `lon` and `lat` arguments of `alcf lidar` or read
     implicitly from raw lidar data files if available (mpl, mpl2nc).
     Default: `none`.
+- `precision: <precision>`: Floating point precision of input data
+    (`float32` or `float64`). Statistics are always accumulated in
+    `float64`. Default: `float64`.
+- `profile: <file>`: Write a JSON report of wall time, number of profiles
+    and bytes processed by reading, statistics and writing to a file.
+    Default: `none`.
 - `tlim: { <start> <end> }`: Time limits (see Time format below).
     Default: `none`.
 - `zlim: { <low> <high> }`: Height limits (m). Default: `{ 0 15000 }`.
@@ -72,6 +101,8 @@ Time format:
 "YYYY-MM-DD[THH:MM[:SS]]", where YYYY is year, MM is month, DD is day,
 HH is hour, MM is minute, SS is second. Example: 2000-01-01T00:00:00.
 	"""
+	if precision not in ('float32', 'float64'):
+		raise ValueError('Invalid precision: %s' % precision)
 	tlim_jd = parse_time(tlim) if tlim is not None else None
 	state = {}
 	options = {
@@ -87,19 +118,47 @@ HH is hour, MM is minute, SS is second. Example: 2000-01-01T00:00:00.
 		'zres': zres,
 	}
 
+	detection_options = {
+		k: v for k, v in [
+			('cloud_threshold', cloud_threshold),
+			('cloud_nsd', cloud_nsd),
+		] if v is not None
+	}
+
+	prof = {}
+
+	def process(dd):
+		t = time.time()
+		ddo = stats.stream(dd, state, **options)
+		misc.profile_update(prof, 'alcf.algorithms.stats.stream',
+			time.time() - t, dd, ddo)
+		return ddo
+
+	def read(filename):
+		t = time.time()
+		d = ds.read(filename, VARIABLES)
+		misc.unpack_cloud_mask(d)
+		if precision != 'float64':
+			misc.set_precision(d, precision)
+		if cloud_threshold is not None or cloud_nsd is not None:
+			cloud_detection.cloud_detection(d, **detection_options)
+		misc.profile_update(prof, 'input', time.time() - t, dd_out=[d])
+		print('<- %s' % filename)
+		return d
+
 	if os.path.isdir(input_):
 		files = sorted(os.listdir(input_))
 		for file_ in files:
 			filename = os.path.join(input_, file_)
 			if not os.path.isfile(filename):
 				continue
-			d = ds.read(filename, VARIABLES)
-			print('<- %s' % filename)
-			dd = stats.stream([d], state, **options)
+			dd = process([read(filename)])
 	else:
-		d = ds.read(input_, VARIABLES)
-		print('<- %s' % input_)
-		dd = stats.stream([d], state, **options)
-	dd = stats.stream([None], state, **options)
+		dd = process([read(input_)])
+	dd = process([None])
 	print('-> %s' % output)
+	t = time.time()
 	ds.write(output, dd[0])
+	misc.profile_update(prof, 'output', time.time() - t, dd_in=dd[:1])
+	if profile is not None:
+		misc.write_profile(profile, prof)
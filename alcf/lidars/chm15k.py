@@ -19,11 +19,25 @@ VARS = {
 	'lat': [],
 }
 
-def read(filename, vars, altitude=None, lon=None, lat=None, **kwargs):
+def read_time(filename):
+	"""Read time (Julian date) of profiles in filename. Returns a tuple of
+	time and its dimensions."""
+	d = ds.from_netcdf(filename, ['time'])
+	return d['time']/(24.0*60.0*60.0) + 2416480.5, d['.']['time']['.dims']
+
+def read(filename, vars, altitude=None, lon=None, lat=None, tlim=None,
+	time=None, **kwargs):
 	dep_vars = list(set([y for x in vars if x in VARS for y in VARS[x]]))
+	i, sel = slice(None), None
+	if tlim is not None:
+		time, dims = time if time is not None else read_time(filename)
+		i, sel = misc.time_sel(time, dims, tlim)
+		if len(i) == 0:
+			return None
 	d = ds.from_netcdf(
 		filename,
 		dep_vars,
+		sel=sel,
 	)
 	dx = {}
 	n, m = d['beta_raw'].shape
@@ -31,12 +45,13 @@ def read(filename, vars, altitude=None, lon=None, lat=None, **kwargs):
 		altitude = d['altitude']
 	if 'time' in vars:
 		dx['time'] = d['time']/(24.0*60.0*60.0) + 2416480.5
-		dx['time_bnds'] = misc.time_bnds(dx['time'], dx['time'][1] - dx['time'][0])
+		if sel is None:
+			time = dx['time']
+		dx['time_bnds'] = misc.time_bnds(time, time[1] - time[0])[i]
 	if 'backscatter' in vars:
 		dx['backscatter'] = d['beta_raw']*1e-11*CALIBRATION_COEFF
 	if 'zfull' in vars:
-		zfull1 = d['range'] + altitude
-		dx['zfull'] = np.tile(zfull1, (n, 1))
+		dx['zfull'] = d['range'] + altitude
 	if 'altitude' in vars:
 		dx['altitude'] = np.full(n, altitude, np.float64)
 	if 'lon' in vars:
@@ -49,4 +64,6 @@ def read(filename, vars, altitude=None, lon=None, lat=None, **kwargs):
 		for x in vars
 		if x in VARS
 	}
+	if 'zfull' in dx['.']:
+		dx['.']['zfull'] = dict(dx['.']['zfull'], **{'.dims': ['level']})
 	return dx
@@ -10,6 +10,9 @@ SURFACE_LIDAR = True
 SC_LR = 18.8 # sr. Stratocumulus lidar ratio (O'Connor et al., 2004).
 MAX_RANGE = 7700 # m
 
+def read_time(filename):
+	return cl51.read_time(filename)
+
 def read(filename, vars, **kwargs):
 	return cl51.read(filename, vars,
 		calibration_coeff=CALIBRATION_COEFF,
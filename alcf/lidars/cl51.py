@@ -21,6 +21,12 @@ DEFAULT_VARS = [
 	'detection_status',
 ]
 
+def read_time(filename):
+	"""Read time (Julian date) of profiles in filename. Returns a tuple of
+	time and its dimensions."""
+	d = ds.from_netcdf(filename, ['time'])
+	return d['time']/(24.0*60.0*60.0) + 2440587.5, d['.']['time']['.dims']
+
 def read(filename, vars,
 	altitude=None,
 	lon=None,
@@ -28,25 +34,35 @@ def read(filename, vars,
 	calibration_coeff=CALIBRATION_COEFF,
 	fix_cl_range=False,
 	cl_crit_range=6000,
+	tlim=None,
+	time=None,
 	**kwargs
 ):
 	dep_vars = list(set([y for x in vars if x in VARS for y in VARS[x]]))
 	required_vars = dep_vars + DEFAULT_VARS
+	i, sel = slice(None), None
+	if tlim is not None:
+		time, dims = time if time is not None else read_time(filename)
+		i, sel = misc.time_sel(time, dims, tlim)
+		if len(i) == 0:
+			return None
 	d = ds.from_netcdf(
 		filename,
-		required_vars
+		required_vars,
+		sel=sel,
 	)
 	dx = {}
 	dx['time'] = d['time']/(24.0*60.0*60.0) + 2440587.5
-	dx['time_bnds'] = misc.time_bnds(dx['time'], dx['time'][1] - dx['time'][0])
+	if sel is None:
+		time = dx['time']
+	dx['time_bnds'] = misc.time_bnds(time, time[1] - time[0])[i]
 
 	n = len(dx['time'])
 	range_ = d['vertical_resolution'][0]*d['level']
 	if 'zfull' in vars:
-		zfull1 = range_
-		dx['zfull'] = np.tile(zfull1, (n, 1))
-		if altitude is not None:
-			dx['zfull'] += altitude
+		dx['zfull'] = range_ + altitude \
+			if altitude is not None \
+			else range_
 	if 'backscatter' in vars:
 		dx['backscatter'] = d['backscatter']*calibration_coeff
 		mask = range_ > 6000
@@ -66,4 +82,6 @@ def read(filename, vars,
 		for x in vars
 		if x in dx['.']
 	}
+	if 'zfull' in dx['.']:
+		dx['.']['zfull'] = dict(dx['.']['zfull'], **{'.dims': ['level']})
 	return dx
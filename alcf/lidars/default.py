@@ -1,5 +1,6 @@
 import numpy as np
 import ds_format as ds
+from alcf import misc
 from alcf.lidars import META
 
 WAVELENGTH = 1064 # nm
@@ -7,8 +8,21 @@ CALIBRATION_COEFF = 1.0
 SURFACE_LIDAR = None
 SC_LR = None
 
-def read(filename, vars, altitude=None, lon=None, lat=None, **kwargs):
-	d = ds.from_netcdf(filename, vars)
+def read_time(filename):
+	"""Read time (Julian date) of profiles in filename. Returns a tuple of
+	time and its dimensions."""
+	d = ds.from_netcdf(filename, ['time'])
+	return d['time'], d['.']['time']['.dims']
+
+def read(filename, vars, altitude=None, lon=None, lat=None, tlim=None,
+	time=None, **kwargs):
+	sel = None
+	if tlim is not None:
+		time, dims = time if time is not None else read_time(filename)
+		i, sel = misc.time_sel(time, dims, tlim)
+		if len(i) == 0:
+			return None
+	d = ds.from_netcdf(filename, vars, sel=sel)
 	n = d['backscatter'].shape[0]
 	d['altitude'] = d['altitude'] if altitude is None and 'altitude' in d else \
 		np.full(n, altitude, np.float64)
@@ -24,5 +38,7 @@ def read(filename, vars, altitude=None, lon=None, lat=None, **kwargs):
 		for x in vars
 		if x in d['.']
 	}
+	misc.squeeze_zfull(d)
+	misc.unpack_cloud_mask(d)
 	return d
 
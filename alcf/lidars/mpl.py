@@ -16,19 +16,22 @@ VARS = {
 	'backscatter_y': ['copol_nrb', 'crosspol_nrb'],
 }
 
-DEFAULT_VARS = [
-	'range_nrb',
-	'elevation_angle',
+TIME_VARS = [
 	'year',
 	'month',
 	'day',
 	'hour',
 	'minute',
 	'second',
+]
+
+DEFAULT_VARS = [
+	'range_nrb',
+	'elevation_angle',
 	'altitude',
 	'latitude',
 	'longitude',
-]
+] + TIME_VARS
 
 def parse_temporal_resolution(s):
 	errmsg = 'Unrecognized temporal resolution "%s"' % s
@@ -49,12 +52,34 @@ def parse_temporal_resolution(s):
 			return f*item[1]
 	raise ValueError(errmsg)
 
-def read(filename, vars, altitude=None, lon=None, lat=None, **kwargs):
+def get_time(d):
+	"""Get time (Julian date) from the date and time variables of dataset d"""
+	return np.array([
+		(dt.datetime(y, m, day, H, M, S) - dt.datetime(1970, 1, 1)).total_seconds()/(24.0*60.0*60.0) + 2440587.5
+		for y, m, day, H, M, S
+		in zip(d['year'], d['month'], d['day'], d['hour'], d['minute'], d['second'])
+	], np.float64)
+
+def read_time(filename):
+	"""Read time (Julian date) of profiles in filename. Returns a tuple of
+	time and its dimensions."""
+	d = ds.from_netcdf(filename, TIME_VARS)
+	return get_time(d), d['.']['year']['.dims']
+
+def read(filename, vars, altitude=None, lon=None, lat=None, tlim=None,
+	time=None, **kwargs):
 	dep_vars = list(set([y for x in vars if x in VARS for y in VARS[x]]))
 	required_vars = dep_vars + DEFAULT_VARS
+	sel = None
+	if tlim is not None:
+		time, dims = time if time is not None else read_time(filename)
+		i, sel = misc.time_sel(time, dims, tlim)
+		if len(i) == 0:
+			return None
 	d = ds.from_netcdf(
 		filename,
-		required_vars
+		required_vars,
+		sel=sel,
 	)
 	mask = d['elevation_angle'] == 0.0
 	dx = {}
@@ -68,22 +93,16 @@ def read(filename, vars, altitude=None, lon=None, lat=None, **kwargs):
 		np.full(n, lat, np.float64)
 
 	if 'time' in vars:
-		dx['time'] = np.array([
-			(dt.datetime(y, m, day, H, M, S) - dt.datetime(1970, 1, 1)).total_seconds()/(24.0*60.0*60.0) + 2440587.5
-			for y, m, day, H, M, S
-			in zip(d['year'], d['month'], d['day'], d['hour'], d['minute'], d['second'])
-		], np.float64)
+		dx['time'] = get_time(d)
 		tres = parse_temporal_resolution(d['.']['.']['temporal_resolution'])
 		dx['time_bnds'] = misc.time_bnds(dx['time'], tres)
 		# dx['time'] += 13.0/24.0
 	if 'zfull' in vars:
-		zfull1 = np.outer(
+		dx['zfull'] = np.outer(
 			np.sin(d['elevation_angle']/180.0*np.pi),
 			d['range_nrb']*1e3
 		)
-		dx['zfull'] = np.tile(zfull1, (n, 1))
-		for i in range(n):
-			dx['zfull'][i,:] += altitude[i]
+		dx['zfull'] += altitude[:,np.newaxis]
 	if 'backscatter' in vars:
 		dx['backscatter'] = (d['copol_nrb'] + 2.*d['crosspol_nrb'])*CALIBRATION_COEFF
 	if 'altitude' in vars:
@@ -112,4 +131,5 @@ def read(filename, vars, altitude=None, lon=None, lat=None, **kwargs):
 		for x in vars
 		if x in dx['.']
 	}
+	misc.squeeze_zfull(dx)
 	return dx
@@ -22,8 +22,21 @@ VARIABLES = [
 	'gps_latitude',
 ]
 
-def read(filename, vars, altitude=None, lon=None, lat=None, **kwargs):
-	d = ds.read(filename, VARIABLES, jd=True)
+def read_time(filename):
+	"""Read time (Julian date) of profiles in filename. Returns a tuple of
+	time and its dimensions."""
+	d = ds.read(filename, ['time'], jd=True)
+	return d['time'], d['.']['time']['.dims']
+
+def read(filename, vars, altitude=None, lon=None, lat=None, tlim=None,
+	time=None, **kwargs):
+	i, sel = slice(None), None
+	if tlim is not None:
+		time, dims = time if time is not None else read_time(filename)
+		i, sel = misc.time_sel(time, dims, tlim)
+		if len(i) == 0:
+			return None
+	d = ds.read(filename, VARIABLES, sel=sel, jd=True)
 	mask = d['elevation_angle'] == 0.0
 	dx = {}
 	n, m = d['nrb_copol'].shape
@@ -37,13 +50,13 @@ def read(filename, vars, altitude=None, lon=None, lat=None, **kwargs):
 
 	if 'time' in vars:
 		dx['time'] = d['time']
-		dx['time_bnds'] = misc.time_bnds(dx['time'], dx['time'][1] - dx['time'][0])
+		if sel is None:
+			time = dx['time']
+		dx['time_bnds'] = misc.time_bnds(time, time[1] - time[0])[i]
 	if 'zfull' in vars:
-		dx['zfull'] = np.full((n, m), np.nan, np.float64)
-		for i in range(n):
-			range_ = 0.5*d['bin_time'][i]*d['c']*(np.arange(m) + 0.5)
-			dx['zfull'][i,:] = range_*np.sin(d['elevation_angle'][i]/180.0*np.pi)
-			dx['zfull'][i,:] += altitude[i]
+		range_ = 0.5*np.outer(d['bin_time']*d['c'], np.arange(m) + 0.5)
+		dx['zfull'] = range_*np.sin(d['elevation_angle']/180.0*np.pi)[:,np.newaxis]
+		dx['zfull'] += altitude[:,np.newaxis]
 	if 'backscatter' in vars:
 		dx['backscatter'] = (d['nrb_copol'] + 2.*d['nrb_crosspol'])*CALIBRATION_COEFF
 	if 'altitude' in vars:
@@ -58,4 +71,5 @@ def read(filename, vars, altitude=None, lon=None, lat=None, **kwargs):
 		for x in vars
 		if x in dx['.']
 	}
+	misc.squeeze_zfull(dx)
 	return dx
@@ -1,4 +1,9 @@
 import copy
+import json
+import time
+import logging
+import traceback
+import itertools
 import numpy as np
 import astropy.coordinates
 import astropy.time
@@ -15,58 +20,241 @@ def parse_time(time):
 		raise ValueError('Invalid time: %s' % time)
 	return [start, end]
 
+def select_time(d, i1, i2):
+	"""Select time range i1 to i2 of dataset d as views of its arrays"""
+	dx = copy.copy(d)
+	dx['.'] = copy.deepcopy(d['.'])
+	for var in ds.get_vars(d):
+		dims = d['.'][var]['.dims']
+		if 'time' in dims:
+			i = dims.index('time')
+			dx[var] = d[var][(slice(None),)*i + (slice(i1, i2),)]
+	return dx
+
+def dim_size(d, dim):
+	"""Get the size of dimension dim in dataset d"""
+	for var in ds.get_vars(d):
+		dims = d['.'].get(var, {}).get('.dims', [])
+		if dim in dims:
+			return np.shape(d[var])[dims.index(dim)]
+	return 0
+
+def buffer_append(buf, d, dim='time'):
+	"""Append dataset d to buffer buf (dict) along dimension dim.
+
+	Variables with dimension dim are stored in preallocated arrays with dim as
+	the first axis, whose capacity is doubled when full. Variables without
+	dimension dim are taken from the first dataset, or expanded along dim if
+	they differ between datasets (e.g. 1D zfull). Variables missing in some
+	datasets are filled with missing values. The first dataset is only stored
+	by reference and copied when another dataset is appended.
+	"""
+	if 'n' not in buf:
+		buf['n'] = dim_size(d, dim)
+		buf['first'] = d
+		return
+	if 'first' in buf:
+		d0 = buf.pop('first')
+		buf.update({'n': 0, 'vars': {}, 'masks': {}, 'fixed': {}, 'meta': {}})
+		buf['meta'].update(copy.deepcopy(d0['.']))
+		buffer_append(buf, d0, dim)
+	n = buf['n']
+	n1 = dim_size(d, dim)
+	stored = set()
+	for var in ds.get_vars(d):
+		dims = d['.'].get(var, {}).get('.dims', [])
+		if var not in buf['meta']:
+			buf['meta'][var] = copy.deepcopy(d['.'].get(var, {}))
+		if dim in dims:
+			x = np.moveaxis(np.asanyarray(d[var]), dims.index(dim), 0)
+		elif var in buf['vars'] or (var in buf['fixed'] and \
+			not np.array_equal(buf['fixed'][var], d[var])):
+			x = np.broadcast_to(d[var], (n1,) + np.shape(d[var]))
+		else:
+			buf['fixed'].setdefault(var, d[var])
+			continue
+		if var in buf['fixed']:
+			x0 = buf['fixed'].pop(var)
+			_buffer_store(buf, var, np.broadcast_to(x0, (n,) + np.shape(x0)), 0)
+			buf['meta'][var]['.dims'] = [dim] + buf['meta'][var].get('.dims', [])
+		_buffer_store(buf, var, x, n)
+		stored.add(var)
+	buf['n'] = n + n1
+	for var in buf['vars']:
+		if var not in stored:
+			_buffer_store(buf, var, None, n, n1)
+
+def _buffer_store(buf, var, x, i, n1=None):
+	"""Store array x (or missing values if None) at index i of buffer variable
+	var"""
+	if x is not None:
+		n1 = len(x)
+	y = buf['vars'].get(var)
+	if y is None:
+		y = np.empty((max(i + n1, 1),) + x.shape[1:], x.dtype)
+		buf['vars'][var] = y
+		if i > 0:
+			buf['masks'][var] = np.ones(y.shape, bool)
+	elif len(y) < i + n1:
+		y = np.empty((max(2*len(y), i + n1),) + y.shape[1:], y.dtype)
+		y[:i] = buf['vars'][var][:i]
+		buf['vars'][var] = y
+		if var in buf['masks']:
+			m = np.ones(y.shape, bool)
+			m[:i] = buf['masks'][var][:i]
+			buf['masks'][var] = m
+	if x is None or np.ma.isMaskedArray(x) and var not in buf['masks']:
+		m = np.ones(y.shape, bool)
+		m[:i] = False
+		buf['masks'].setdefault(var, m)
+	if x is None:
+		buf['masks'][var][i:(i + n1)] = True
+		return
+	y[i:(i + n1)] = np.ma.getdata(x)
+	if var in buf['masks']:
+		buf['masks'][var][i:(i + n1)] = np.ma.getmaskarray(x)
+
+def buffer_get(buf, dim='time'):
+	"""Get the contents of buffer buf as a dataset of views of the buffer
+	storage and empty the buffer"""
+	if 'n' not in buf:
+		return {'.': {}}
+	if 'first' in buf:
+		d = buf['first']
+		buf.clear()
+		return d
+	n = buf['n']
+	d = {'.': buf['meta']}
+	d.update(buf['fixed'])
+	for var, y in buf['vars'].items():
+		dims = buf['meta'][var]['.dims']
+		x = y[:n]
+		if var in buf['masks']:
+			x = np.ma.array(x, mask=buf['masks'][var][:n])
+		d[var] = np.moveaxis(x, 0, dims.index(dim))
+	buf.clear()
+	return d
+
+# Julian dates in float64 are accurate to about 0.05 ms, so times in whole
+# milliseconds are converted to ticks exactly.
+TICKS_PER_DAY = 86400000
+
+def to_ticks(t):
+	"""Convert Julian date t to ticks (milliseconds) since the start of Julian
+	day 0"""
+	return np.round((np.asarray(t, np.float64) + 0.5)*TICKS_PER_DAY) \
+		.astype(np.int64)
+
+def set_time_ticks(d):
+	"""Store time and time bounds of dataset d as ticks (see to_ticks) in
+	variables time_ticks and time_bnds_ticks. Stages which bin time use them
+	instead of time and time_bnds (see time_units)."""
+	d['time_ticks'] = to_ticks(d['time'])
+	d['time_bnds_ticks'] = to_ticks(d['time_bnds'])
+	d['.']['time_ticks'] = {'.dims': ['time']}
+	d['.']['time_bnds_ticks'] = {'.dims': ['time', 'bnds']}
+
+def rm_time_ticks(d):
+	"""Remove time ticks set by set_time_ticks from dataset d"""
+	for var in ['time_ticks', 'time_bnds_ticks']:
+		if var in d:
+			del d[var]
+			del d['.'][var]
+
+def time_units(d, periods=[]):
+	"""Get time and time bounds of dataset d and periods (days) in units
+	counted from the start of Julian day 0: integer ticks if d has time ticks
+	(see set_time_ticks), in which binning is exact, or else days. Periods
+	are rounded to whole ticks. Returns a tuple of time, time bounds, a list
+	of periods and the number of units per day."""
+	if 'time_bnds_ticks' in d:
+		return d['time_ticks'], d['time_bnds_ticks'], [
+			int(np.round(p*TICKS_PER_DAY)) for p in periods
+		], TICKS_PER_DAY
+	return d['time'] + 0.5, d['time_bnds'] + 0.5, list(periods), 1.
+
+def set_time_bnds(d, time_bnds, unit, time=None):
+	"""Set time bounds of dataset d to time_bnds and time to time (if not
+	None) in units of time_units with unit units per day"""
+	d['time_bnds'] = time_bnds/unit - 0.5
+	if unit == TICKS_PER_DAY:
+		d['time_bnds_ticks'] = time_bnds
+	if time is None:
+		return
+	d['time'] = time/unit - 0.5
+	if unit == TICKS_PER_DAY:
+		d['time_ticks'] = np.floor(time).astype(np.int64)
+
+def time_bins(time_bnds, period):
+	"""Get indices of time bins of length period which contain the start and
+	end of time intervals time_bnds, both in units of time_units"""
+	return np.floor_divide(time_bnds, period).astype(np.int64)
+
+def bin_index(d, period):
+	"""Get indices of time bins of length period (days) which contain the
+	start and end of the profiles in dataset d. The bins are aligned with the
+	start of the day. With time ticks, this is exact integer division."""
+	_, time_bnds, [p], _ = time_units(d, [period])
+	return time_bins(time_bnds, p)
+
 def aggregate(dd, state, period, epsilon=1./86400.):
+	"""Split and merge datasets dd into periods of length period. The
+	datasets returned can share arrays with the input datasets and with each
+	other (a profile crossing a period boundary is included in both periods),
+	so they should not be modified in place."""
 	dd = state.get('dd', []) + dd
 	state['dd'] = []
-	
-	if len(dd) == 0 or dd[0] is None:
+	state['buffer'] = buf = state.get('buffer', {})
+
+	if len(dd) == 0 or dd[0] is None and len(buf) == 0:
 		return dd
 
-	def merge(dd, t1, t2):
-		if len(ddb) > 0:
-			dx = ds.merge(ddb, 'time')
-			dx['time_bnds'][0,0] = max(t1, dx['time_bnds'][0,0])
-			dx['time_bnds'][-1,1] = min(t2, dx['time_bnds'][-1,1])
-			if dx['time_bnds'][-1,1] > dx['time_bnds'][0,0]:
+	def merge(k):
+		dx = buffer_get(buf)
+		if 'time_bnds' in dx:
+			_, time_bnds, [p], unit = time_units(dx, [period])
+			time_bnds = np.copy(time_bnds)
+			time_bnds[0,0] = max(k*p, time_bnds[0,0])
+			time_bnds[-1,1] = min((k + 1)*p, time_bnds[-1,1])
+			if time_bnds[-1,1] > time_bnds[0,0]:
+				dx = copy.copy(dx)
+				set_time_bnds(dx, time_bnds, unit)
 				return [dx]
 		return []
-	
+
 	ddo = []
-	ddb = []
-	t = dd[0]['time_bnds'][0,0]
-	r = (t + 0.5) % period
-	t1 = state.get('t1', t - r)
-	t2 = state.get('t2', t1 + period)
+	if 'k' in state:
+		k = state['k']
+	else:
+		k = int(bin_index(dd[0], period)[0,0])
 	for d in dd:
 		if d is None:
-			ddo += merge(ddb, t1, t2) + [None]
+			ddo += merge(k) + [None]
 			break
+		n = len(d['time'])
+		if n == 0:
+			continue
+		_, time_bnds, [p, eps], _ = time_units(d, [period, epsilon])
+		start = time_bnds[:,0]
+		# Profile i completes all periods up to kend[i] and starts in period
+		# kstart[i].
+		kb = time_bins(time_bnds, p)
+		kend = np.maximum(kb[:,1] - 1, k - 1)
+		kstart = np.maximum(kb[:,0], k)
+		kprev = np.maximum.accumulate(np.concatenate([[k - 1], kend]))[:-1]
 		i1 = 0
-		i = 0
-		while i < len(d['time']):
-			if not (d['time_bnds'][i,1] >= t2):
-				i += 1
-				continue
-			ii = np.arange(i1, i + (t2 - d['time_bnds'][i,0] > epsilon))
-			if len(ii) > 0:
-				dx = copy.copy(d)
-				ds.select(dx, {'time': ii})
-				ddb += [dx]
-			ddo += merge(ddb, t1, t2)
-			i1 = i
-			t = d['time_bnds'][i,0]
-			r = (t + 0.5) % period
-			t1 = max(t2, t - r)
-			t2 = t1 + period
-			ddb = []
-		ii = np.arange(i1, len(d['time']))
-		if len(ii) > 0:
-			dx = copy.copy(d)
-			ds.select(dx, {'time': ii})
-			ddb += [dx]
-	state['dd'] = ddb
-	state['t1'] = t1
-	state['t2'] = t2
+		for i in np.flatnonzero(kend > kprev):
+			kk = [kprev[i] + 1] + \
+				list(range(max(kprev[i] + 2, kstart[i]), kend[i] + 1))
+			for k in kk:
+				i2 = i + ((k + 1)*p - start[i] > eps)
+				if i2 > i1:
+					buffer_append(buf, select_time(d, i1, i2))
+				ddo += merge(k)
+				i1 = i
+			k = int(kend[i]) + 1
+		buffer_append(buf, select_time(d, i1, n))
+	state['k'] = k
 	return ddo
 
 def stream(dd, state, f, **options):
@@ -79,13 +267,248 @@ def stream(dd, state, f, **options):
 	state['dd'] = []
 	return dd[:(i+1)]
 
+def pipeline(dd, stages, warn=False, profile=None):
+	"""Pass datasets from an iterable dd lazily through a pipeline of stages.
+
+	stages is a list of tuples (f, options), where f is a stream function
+	f(dd, state, **options) such as misc.stream or the stream functions of the
+	processing algorithms. Every stage runs as a generator, which passes a
+	dataset to f as soon as it is produced by the previous stage and yields
+	the datasets returned by f. When the input is exhausted, the stage is
+	flushed by passing None to f. Returns a generator of the datasets produced
+	by the last stage. If warn is true, errors in processing a dataset are
+	logged as warnings and the dataset is skipped. If profile is a dict, the
+	time spent producing the input datasets and in every stage is recorded
+	in it (see profile_update).
+	"""
+	if profile is not None:
+		dd = pipeline_input(dd, profile)
+	for f, options in stages:
+		dd = pipeline_stage(dd, f, options, warn, profile)
+	return dd
+
+def pipeline_input(dd, profile):
+	dd = iter(dd)
+	while True:
+		t = time.time()
+		try:
+			d = next(dd)
+		except StopIteration:
+			return
+		profile_update(profile, 'input', time.time() - t, dd_out=[d])
+		yield d
+
+def stage_name(f, options):
+	"""Get the name of a pipeline stage (f, options)"""
+	name = '%s.%s' % (f.__module__, f.__name__)
+	if 'f' in options:
+		name += '(%s)' % options['f'].__name__
+	return name
+
+def pipeline_stage(dd, f, options, warn=False, profile=None):
+	state = {}
+	name = stage_name(f, options)
+	for d in itertools.chain(dd, [None]):
+		for dx in stage_step(d, state, f, options, name, warn, profile):
+			yield dx
+
+def stage_step(d, state, f, options, name, warn=False, profile=None):
+	"""Pass a dataset d (or None to flush) to a pipeline stage (f, options)
+	with state. Returns a list of the datasets produced by the stage. If warn
+	is true, errors in processing the dataset are logged as warnings and no
+	datasets are returned."""
+	# Shallow copy of the input dataset, which the stage can modify.
+	d0 = copy.copy(d)
+	t = time.time()
+	try:
+		ddo = f([d], state, **options)
+	except Exception:
+		if not warn or d is None:
+			raise
+		logging.warning(traceback.format_exc())
+		return []
+	if profile is not None:
+		profile_update(profile, name, time.time() - t, [d0], ddo)
+	return [dx for dx in ddo if dx is not None]
+
+def share(d):
+	"""Get a copy of dataset d which shares its arrays as read-only views
+	(not owned, see owned) and has its own metadata"""
+	dx = {}
+	for var, x in d.items():
+		if var == '.':
+			dx[var] = {k: dict(v) for k, v in x.items()}
+		elif isinstance(x, np.ndarray):
+			dx[var] = x.view()
+			dx[var].flags.writeable = False
+		else:
+			dx[var] = x
+	return dx
+
+def branch(dd, state, branches, warn=False, profile=None):
+	"""Stream function which passes datasets dd through every branch of
+	branches, a list of tuples (name, stages), where stages are pipeline
+	stages as in pipeline. Every branch receives its own copy of the datasets
+	(see share). The stages of a branch are recorded in profile under names
+	prefixed with the name of the branch. Returns no datasets except None
+	at the end of the stream."""
+	states = state.setdefault('states', [
+		[{} for _ in stages] for _, stages in branches
+	])
+	for (name, stages), states1 in zip(branches, states):
+		for d in dd:
+			ddb = [share(d) if d is not None else None]
+			for (f, options), state1 in zip(stages, states1):
+				name1 = '%s: %s' % (name, stage_name(f, options))
+				ddb = [
+					dx
+					for d1 in ddb
+					for dx in stage_step(d1, state1, f, options, name1,
+						warn, profile)
+				] + ([None] if d is None else [])
+	return [None] if None in dd else []
+
+def profile_update(profile, name, time_, dd_in=[], dd_out=[]):
+	"""Add wall time time_ (s) and the number of profiles and bytes of input
+	datasets dd_in and output datasets dd_out to the record of stage name in
+	profile (dict)"""
+	def size(dd):
+		dd = [d for d in dd if d is not None]
+		return (
+			int(np.sum([dim_size(d, 'time') for d in dd])),
+			int(np.sum([
+				np.asarray(d[var]).nbytes
+				for d in dd
+				for var in ds.get_vars(d)
+			])),
+		)
+	profile.setdefault('start', time.time() - time_)
+	stages = profile.setdefault('stages', {})
+	x = stages.setdefault(name, {
+		'calls': 0,
+		'time': 0.,
+		'profiles_in': 0,
+		'profiles_out': 0,
+		'bytes_in': 0,
+		'bytes_out': 0,
+	})
+	n_in, bytes_in = size(dd_in)
+	n_out, bytes_out = size(dd_out)
+	x['calls'] += 1
+	x['time'] += time_
+	x['profiles_in'] += n_in
+	x['profiles_out'] += n_out
+	x['bytes_in'] += bytes_in
+	x['bytes_out'] += bytes_out
+
+def write_profile(filename, profile):
+	"""Write a JSON report of stage timing recorded in profile (see
+	profile_update) to filename"""
+	report = {
+		'time': time.time() - profile.get('start', time.time()),
+		'stages': [
+			dict(name=name, **x)
+			for name, x in profile.get('stages', {}).items()
+		],
+	}
+	with open(filename, 'w') as f:
+		json.dump(report, f, indent=4)
+	print('-> %s' % filename)
+
 def half(xfull):
-	xhalf = np.zeros(len(xfull) + 1, dtype=xfull.dtype)
-	xhalf[1:-1] = 0.5*(xfull[1:] + xfull[:-1])
-	xhalf[0] = 2.*xfull[0] - xfull[1]
-	xhalf[-1] = 2.*xfull[-1] - xfull[-2]
+	shape = list(xfull.shape)
+	shape[-1] += 1
+	xhalf = np.zeros(shape, dtype=xfull.dtype)
+	xhalf[...,1:-1] = 0.5*(xfull[...,1:] + xfull[...,:-1])
+	xhalf[...,0] = 2.*xfull[...,0] - xfull[...,1]
+	xhalf[...,-1] = 2.*xfull[...,-1] - xfull[...,-2]
 	return xhalf
 
+def squeeze_zfull(d):
+	"""Replace 2D zfull in dataset d with 1D zfull if it is the same for all
+	profiles"""
+	zfull = d.get('zfull')
+	if zfull is None or zfull.ndim != 2 or len(zfull) == 0 or \
+		not np.all(zfull == zfull[0]):
+		return
+	d['zfull'] = zfull[0]
+	d['.']['zfull'] = dict(d['.']['zfull'], **{'.dims': ['level']})
+
+def set_precision(d, dtype):
+	"""Convert floating point variables of dataset d except time and time
+	bounds to dtype"""
+	for var in ds.get_vars(d):
+		x = d[var]
+		if var in ('time', 'time_bnds') or \
+			not isinstance(x, np.ndarray) or \
+			not np.issubdtype(x.dtype, np.floating):
+			continue
+		d[var] = x.astype(dtype, copy=False)
+
+def owned(x):
+	"""Check if array x can be modified in place by the dataset holding it,
+	i.e. it is writeable and owns its memory (is not a view of another array).
+	For a masked array, its data must own their memory. Arrays shared between
+	datasets are passed as views (see aggregate) or read-only arrays (see
+	np.broadcast_to), so they are never owned."""
+	if not isinstance(x, np.ndarray) or not x.flags.writeable:
+		return False
+	if np.ma.isMaskedArray(x):
+		x = x.base
+	return isinstance(x, np.ndarray) and x.flags.owndata
+
+def own(d, var):
+	"""Get variable var of dataset d for modification in place. The variable
+	is replaced with a copy if it is not owned (see owned)."""
+	if not owned(d[var]):
+		d[var] = d[var].copy()
+	return d[var]
+
+def scratch(buf, name, shape, dtype):
+	"""Get a scratch array of shape and dtype for temporary values, reusing
+	memory stored under name in buffer buf (dict) between calls. The
+	contents are undefined and valid only until the next call with the same
+	name."""
+	size = int(np.prod(shape))
+	x = buf.get(name)
+	if x is None or x.dtype != dtype or len(x) < size:
+		x = np.empty(size, dtype)
+		buf[name] = x
+	return x[:size].reshape(shape)
+
+def pack_cloud_mask(d):
+	"""Pack cloud mask in dataset d into bits along the level axis (8 levels
+	per byte)"""
+	cloud_mask = d.get('cloud_mask')
+	meta = d['.'].get('cloud_mask', {})
+	if cloud_mask is None or 'packed_dim' in meta:
+		return
+	meta = {k: v for k, v in meta.items() if k not in ('.size', '.type')}
+	dims = list(meta['.dims'])
+	d['cloud_mask'] = np.packbits(np.asarray(cloud_mask) != 0, axis=1)
+	d['.']['cloud_mask'] = dict(meta, **{
+		'.dims': [dims[0], dims[1] + '_bits'] + dims[2:],
+		'packed_dim': dims[1],
+		'packed_size': cloud_mask.shape[1],
+	})
+
+def unpack_cloud_mask(d):
+	"""Unpack cloud mask in dataset d if it is packed into bits by
+	pack_cloud_mask"""
+	cloud_mask = d.get('cloud_mask')
+	meta = d['.'].get('cloud_mask', {})
+	if cloud_mask is None or 'packed_dim' not in meta:
+		return
+	meta = {k: v for k, v in meta.items() if k not in ('.size', '.type')}
+	dim = meta.pop('packed_dim')
+	size = int(meta.pop('packed_size'))
+	# Bytes with all bits set are equal to the default fill value of uint8 and
+	# read as masked, so the mask is ignored.
+	x = np.ma.getdata(cloud_mask).astype(np.uint8, copy=False)
+	d['cloud_mask'] = np.unpackbits(x, axis=1, count=size).astype(np.byte)
+	meta['.dims'] = [meta['.dims'][0], dim] + list(meta['.dims'][2:])
+	d['.']['cloud_mask'] = meta
+
 def time_bnds(time, step, start=None, end=None):
 	n = len(time)
 	bnds = np.full((n, 2), np.nan, time.dtype)
@@ -99,6 +522,63 @@ def time_bnds(time, step, start=None, end=None):
 		bnds[-1,1] = end
 	return bnds
 
+def time_index(time):
+	"""Create an index (dict) of time (array) sorted for lookups by
+	time_nearest and time_range"""
+	time = np.asarray(time, np.float64)
+	if np.all(time[1:] >= time[:-1]):
+		order = np.arange(len(time))
+	else:
+		order = np.argsort(time, kind='stable')
+	return {'time': time[order], 'order': order}
+
+def time_nearest(index, t):
+	"""Find indices of the times nearest to t (scalar or array) in the time
+	array of index (see time_index). Of equally distant times, the earlier
+	one is returned (the first in the time array if they are equal), which
+	is the same as np.argmin(np.abs(time - t)) for sorted time."""
+	time = index['time']
+	t = np.asarray(t, np.float64)
+	k = np.searchsorted(time, t, side='left')
+	k1 = np.clip(k - 1, 0, len(time) - 1)
+	k2 = np.clip(k, 0, len(time) - 1)
+	k1 = np.searchsorted(time, time[k1], side='left')
+	k = np.where(np.abs(t - time[k1]) <= np.abs(time[k2] - t), k1, k2)
+	return index['order'][k]
+
+def time_range(index, t1, t2):
+	"""Find indices of times in the interval [t1, t2) in the time array of
+	index (see time_index) in ascending order"""
+	time = index['time']
+	i1 = np.searchsorted(time, t1, side='left')
+	i2 = np.searchsorted(time, t2, side='left')
+	return np.sort(index['order'][i1:i2])
+
+def time_sel(time, dims, tlim=None):
+	"""Find indices of times (array of dimensions dims) within time limits
+	tlim [start, end) or all times if tlim is None. Returns a tuple of the
+	indices and a selector of them for ds.read (None if tlim is None). The
+	selector is an index array, because ds.read does not keep the selected
+	dimension in the metadata with a slice."""
+	if tlim is None:
+		return np.arange(len(time)), None
+	i = np.where((time >= tlim[0]) & (time < tlim[1]))[0]
+	return i, {dims[0]: i}
+
+def time_within(time, intervals):
+	"""Find which times (array) are within any of intervals [start, end)
+	(array of shape (n, 2)). Returns a boolean array of the shape of
+	time."""
+	intervals = np.asarray(intervals, np.float64).reshape(-1, 2)
+	time = np.asarray(time)
+	if len(intervals) == 0:
+		return np.zeros(time.shape, bool)
+	intervals = intervals[np.argsort(intervals[:,0], kind='stable')]
+	# The latest end of the intervals starting at or before time.
+	end = np.maximum.accumulate(intervals[:,1])
+	k = np.searchsorted(intervals[:,0], time, side='right') - 1
+	return (k >= 0) & (time < end[np.maximum(k, 0)])
+
 def sun_altitude(t, lon, lat):
 	loc = astropy.coordinates.EarthLocation(
 		lon=lon*astropy.units.deg,
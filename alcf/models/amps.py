@@ -27,8 +27,9 @@ VARS = [
 def read(dirname, track, warnings=[], step=3./24.):
 	dd_index = ds.readdir(dirname, variables=['XTIME'], jd=True)
 	start_time = track['time'][0]
+	track_index = misc.time_index(track['time'])
 	end_time = track['time'][-1]
-	dd = []
+	buf = {}
 	for d_index in dd_index:
 		time = d_index['XTIME'][0]
 		time0 = d_index['.']['.']['SIMULATION_START_DATE']
@@ -37,7 +38,7 @@ def read(dirname, track, warnings=[], step=3./24.):
 			time = time0 + time/(24.*60.)
 		filename = d_index['filename']
 		if (time >= start_time - step*0.5) & (time < end_time + step*0.5):
-			k = np.argmin(np.abs(track['time'] - time))
+			k = misc.time_nearest(track_index, time)
 			lon0 = track['lon'][k]
 			lat0 = track['lat'][k]
 			d = ds.read(filename, variables=VARS, sel={'Time': 0})
@@ -71,8 +72,8 @@ def read(dirname, track, warnings=[], step=3./24.):
 				'time': np.array([time]),
 				'.': META,
 			}
-			dd.append(d_new)
-	d = ds.op.merge(dd, 'time')
+			misc.buffer_append(buf, d_new)
+	d = misc.buffer_get(buf)
 	if 'time' in d:
 		d['time_bnds'] = misc.time_bnds(d['time'], step, start_time, end_time)
 		d['time'] = np.mean(d['time_bnds'], axis=1)
@@ -52,6 +52,7 @@ def read0(type_, dirname, track, warnings=[], step=1./24.):
 		warnings=warnings,
 	)
 	start_time = track['time'][0]
+	track_index = misc.time_index(track['time'])
 	end_time = track['time'][-1]
 
 	vars = {
@@ -64,7 +65,7 @@ def read0(type_, dirname, track, warnings=[], step=1./24.):
 		'plev': TRANS_PLEV,
 	}[type_]
 
-	dd = []
+	buf = {}
 	for d_idx in dd_idx:
 		time = d_idx['time']
 		lat = d_idx['latitude']
@@ -75,9 +76,8 @@ def read0(type_, dirname, track, warnings=[], step=1./24.):
 			(time >= start_time - step*0.5) &
 			(time < end_time + step*0.5)
 		)[0]
-		for i in ii:
+		for i, i2 in zip(ii, misc.time_nearest(track_index, time[ii])):
 			t = time[i]
-			i2 = np.argmin(np.abs(track['time'] - time[i]))
 			lat0 = track['lat'][i2]
 			lon0 = track['lon'][i2]
 			j = np.argmin(np.abs(lat - lat0))
@@ -102,8 +102,8 @@ def read0(type_, dirname, track, warnings=[], step=1./24.):
 				d['ta'] = d['ta'][:,::-1]
 				d['zfull'] = d['zfull'][:,::-1]
 				d['pfull'] = d['pfull'][:,::-1]
-			dd.append(d)
-	d = ds.op.merge(dd, 'time')
+			misc.buffer_append(buf, d)
+	d = misc.buffer_get(buf)
 	if 'time' in d:
 		d['time_bnds'] = misc.time_bnds(d['time'], step, start_time, end_time)
 		d['time'] = np.mean(d['time_bnds'], axis=1)
@@ -52,10 +52,11 @@ def read(dirname, track, warnings=[], step=6./24.):
 		warnings=warnings,
 	)
 	start_time = track['time'][0]
+	track_index = misc.time_index(track['time'])
 	end_time = track['time'][-1]
 	d_out = {}
 	for var in VARS:
-		dd = []
+		buf = {}
 		var2 = TRANS[var]
 		for d_idx in dd_idx:
 			if var not in d_idx['.']:
@@ -68,9 +69,8 @@ def read(dirname, track, warnings=[], step=6./24.):
 				(time >= start_time - step*0.5) &
 				(time < end_time + step*0.5)
 			)[0]
-			for i in ii:
+			for i, i2 in zip(ii, misc.time_nearest(track_index, time[ii])):
 				t = time[i]
-				i2 = np.argmin(np.abs(track['time'] - time[i]))
 				lat0 = track['lat'][i2]
 				lon0 = track['lon'][i2]
 				j = np.argmin(np.abs(lat - lat0))
@@ -100,8 +100,8 @@ def read(dirname, track, warnings=[], step=6./24.):
 					d['pfull'] = d['pfull'][:,::-1]
 					d[var2] = d[var2][:,::-1]
 					ds.select(d, {'pfull': np.arange(27)})
-				dd.append(d)
-		d = ds.op.merge(dd, 'time')
+				misc.buffer_append(buf, d)
+		d = misc.buffer_get(buf)
 		for var_aux in VARS_AUX:
 			if TRANS[var_aux] in ds.get_vars(d_out) \
 				and TRANS[var_aux] in ds.get_vars(d) \
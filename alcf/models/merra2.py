@@ -21,8 +21,9 @@ VARS = [
 def read(dirname, track, warnings=[], step=3./24.):
 	dd_index = ds.readdir(dirname, variables=['time', 'lat', 'lon'], jd=True)
 	start_time = track['time'][0]
+	track_index = misc.time_index(track['time'])
 	end_time = track['time'][-1]
-	dd = []
+	buf = {}
 	for d_index in dd_index:
 		time = d_index['time']
 		lat = d_index['lat']
@@ -33,9 +34,8 @@ def read(dirname, track, warnings=[], step=3./24.):
 			(time >= start_time - step*0.5) &
 			(time < end_time + step*0.5)
 		)[0]
-		for i in ii:
+		for i, i2 in zip(ii, misc.time_nearest(track_index, time[ii])):
 			t = time[i]
-			i2 = np.argmin(np.abs(track['time'] - time[i]))
 			lat0 = track['lat'][i2]
 			lon0 = track['lon'][i2]
 			j = np.argmin(np.abs(lat - lat0))
@@ -68,8 +68,8 @@ def read(dirname, track, warnings=[], step=3./24.):
 				'time': np.array([t]),
 				'.': META,
 			}
-			dd.append(d_new)
-	d = ds.op.merge(dd, 'time')
+			misc.buffer_append(buf, d_new)
+	d = misc.buffer_get(buf)
 	if 'time' in d:
 		d['time_bnds'] = misc.time_bnds(d['time'], step, start_time, end_time)
 		d['time'] = np.mean(d['time_bnds'], axis=1)
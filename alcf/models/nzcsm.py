@@ -21,8 +21,9 @@ def read(dirname, track, warnings=[], step=1./24.):
 	dd_index = ds.readdir(dirname, variables=['time0', 'latitude', 'longitude'],
 		jd=True)
 	start_time = track['time'][0]
+	track_index = misc.time_index(track['time'])
 	end_time = track['time'][1]
-	dd = []
+	buf = {}
 	for d_index in dd_index:
 		time = d_index['time0']
 		lon = d_index['longitude']
@@ -30,8 +31,7 @@ def read(dirname, track, warnings=[], step=1./24.):
 		lat = d_index['latitude']
 		filename = d_index['filename']
 		ii = np.where((time >= start_time - GRACE_TIME) & (time <= end_time + GRACE_TIME))[0]
-		for i in ii:
-			i2 = np.argmin(np.abs(track['time'] - time[i]))
+		for i, i2 in zip(ii, misc.time_nearest(track_index, time[ii])):
 			lon0 = track['lon'][i2]
 			lat0 = track['lat'][i2]
 			l = np.argmin((lon - lon0)**2 + (lat - lat0)**2)
@@ -64,8 +64,8 @@ def read(dirname, track, warnings=[], step=1./24.):
 				'time': np.array([time[i]]),
 				'.': META,
 			}
-			dd.append(d_new)
-	d = ds.op.merge(dd, 'time')
+			misc.buffer_append(buf, d_new)
+	d = misc.buffer_get(buf)
 	if 'time' in d:
 		d['time_bnds'] = misc.time_bnds(d['time'], step)
 	return d
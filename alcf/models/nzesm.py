@@ -30,10 +30,11 @@ def read(dirname, track, warnings=[], step=6./24.):
 		warnings=warnings,
 	)
 	start_time = track['time'][0]
+	track_index = misc.time_index(track['time'])
 	end_time = track['time'][-1]
 	d_var = {}
 	for var in VARIABLES:
-		dd = []
+		buf = {}
 		for d_index in dd_index:
 			if var not in d_index['.']:
 				continue
@@ -44,9 +45,8 @@ def read(dirname, track, warnings=[], step=6./24.):
 			level_height = d_index['level_height']
 			filename = d_index['filename']
 			ii = np.nonzero((time_half[1:] >= start_time) & (time_half[:-1] < end_time))[0]
-			for i in ii:
+			for i, i2 in zip(ii, misc.time_nearest(track_index, time[ii])):
 				t = time[i]
-				i2 = np.argmin(np.abs(track['time'] - time[i]))
 				lat0 = track['lat'][i2]
 				lon0 = track['lon'][i2]
 				j = np.argmin(np.abs(lat - lat0))
@@ -66,9 +66,10 @@ def read(dirname, track, warnings=[], step=6./24.):
 				d_new[TRANS[var]] = d[var].reshape([1] + list(d[var].shape))
 				if TRANS[var] == 'cl':
 					d_new[TRANS[var]] *= 100.
-				dd.append(d_new)
-		if len(dd) > 0:
-			d_var[TRANS[var]] = ds.op.merge(dd, 'time')
+				misc.buffer_append(buf, d_new)
+		d = misc.buffer_get(buf)
+		if 'time' in d:
+			d_var[TRANS[var]] = d
 	time_list = [
 		set(d_var[var]['time'])
 		for var in d_var.keys()
@@ -46,9 +46,10 @@ def read(dirname, track, warnings=[], step=1./24.):
 		warnings=warnings,
 	)
 	start_time = track['time'][0]
+	track_index = misc.time_index(track['time'])
 	end_time = track['time'][-1]
 
-	dd = []
+	buf = {}
 	for d_idx in dd_idx:
 		if 'TALLTS' not in d_idx:
 			continue
@@ -62,9 +63,8 @@ def read(dirname, track, warnings=[], step=1./24.):
 			(time >= start_time - step*0.5) &
 			(time < end_time + step*0.5)
 		)[0]
-		for i in ii:
+		for i, i2 in zip(ii, misc.time_nearest(track_index, time[ii])):
 			t = time[i]
-			i2 = np.argmin(np.abs(track['time'] - time[i]))
 			lat0 = track['lat'][i2]
 			lon0 = track['lon'][i2]
 			j = np.argmin(np.abs(lat - lat0))
@@ -87,8 +87,8 @@ def read(dirname, track, warnings=[], step=1./24.):
 			d['orog'] = np.array([orog], np.float64)
 			d['.']['orog'] = {'.dims': ['time']}
 			del d['eta']
-			dd.append(d)
-	d = ds.op.merge(dd, 'time')
+			misc.buffer_append(buf, d)
+	d = misc.buffer_get(buf)
 	d['cl'] *= 100.
 	if 'time' in d:
 		d['time_bnds'] = misc.time_bnds(d['time'], step, start_time, end_time)
@@ -0,0 +1,66 @@
+import numpy as np
+from alcf.algorithms import interp, interp_batch
+
+XHALF = np.arange(11.)*100.
+XHALF2 = np.array([0., 150., 300., 600., 1000.])
+
+def profiles():
+	rng = np.random.default_rng(1)
+	y = rng.uniform(size=(4, 10))
+	mask = np.zeros(y.shape, bool)
+	mask[1,2] = True
+	mask[3,7:] = True
+	return np.ma.array(np.where(mask, -499.5, y), mask=mask)
+
+def check_masked(xhalf, y, y2):
+	"""Check that masked values in y are interpolated as NaN"""
+	expected = interp_batch(xhalf, y.filled(np.nan), XHALF2)
+	assert np.array_equal(y2, expected, equal_nan=True)
+	assert np.any(np.isnan(y2[1])) and np.any(np.isnan(y2[3]))
+	assert np.all(np.isfinite(y2[[0,2]]))
+	assert not np.any(y2 == -499.5)
+
+def check_masked_levels(y2):
+	"""Check that only the target levels overlapping masked values are NaN"""
+	nan = np.zeros(y2.shape, bool)
+	nan[1,1] = True
+	nan[3,3] = True
+	assert np.array_equal(np.isnan(y2), nan)
+
+def test_interp_batch_unmasked():
+	y = profiles().filled(0.)
+	y2 = interp_batch(XHALF, y, XHALF2)
+	for i in range(y.shape[0]):
+		assert np.allclose(y2[i], interp(XHALF, y[i], XHALF2), rtol=1e-12, atol=0)
+
+def test_interp_batch_masked_operator():
+	y = profiles()
+	y2 = interp_batch(XHALF, y, XHALF2)
+	check_masked(XHALF, y, y2)
+	check_masked_levels(y2)
+
+def reference(xhalf, y):
+	"""Interpolate masked profiles y with interp profile by profile. Target
+	levels with a non-zero overlap with a masked value are NaN."""
+	y2 = np.zeros((y.shape[0], len(XHALF2) - 1))
+	for i in range(y.shape[0]):
+		y2[i] = interp(xhalf[i], y.filled(0.)[i], XHALF2)
+		mask = interp(xhalf[i], np.ma.getmaskarray(y)[i].astype(float), XHALF2)
+		y2[i, mask > 0] = np.nan
+	return y2
+
+def test_interp_batch_masked_integral():
+	# Per-profile half-levels are interpolated by interp_integral.
+	y = profiles()
+	xhalf = XHALF + np.arange(4)[:,np.newaxis]*10.
+	y2 = interp_batch(xhalf, y, XHALF2)
+	expected = reference(xhalf, y)
+	assert np.allclose(y2, expected, rtol=1e-12, atol=0, equal_nan=True)
+	assert np.sum(np.isnan(y2)) > 0
+	assert np.all(np.isfinite(y2[[0,2]]))
+
+def test_interp_batch_masked_float32():
+	y = profiles().astype(np.float32)
+	y2 = interp_batch(XHALF, y, XHALF2)
+	assert y2.dtype == np.float32
+	check_masked(XHALF, y, y2)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from alcf.algorithms import kernels
+
+pytestmark = pytest.mark.skipif(kernels.numba is None,
+	reason='Numba is not installed')
+
+HALF = np.arange(0., 2.05, 0.1)
+
+def inputs(l=None):
+	"""Backscatter, cloud mask, molecular backscatter and profile selection
+	of shape (n, m) or (n, m, l) with NaN and masked rows and values on the
+	edges of the histogram bins"""
+	rng = np.random.default_rng(4)
+	n, m = 30, 12
+	shape = (n, m) if l is None else (n, m, l)
+	b = rng.uniform(-0.5, 2.5, size=shape)
+	b[3] = np.nan
+	b[5,2] = np.nan
+	b[7,0] = HALF[0]
+	b[7,1] = HALF[-1]
+	b[7,2] = HALF[4]
+	mask = np.zeros(shape, bool)
+	mask[9] = True
+	mask[11,4] = True
+	b = np.ma.array(b, mask=mask)
+	cloud_mask = (rng.uniform(size=shape) > 0.7).astype(np.int8)
+	bmol = rng.uniform(size=(n, m))
+	bmol[13] = np.nan
+	sel = rng.uniform(size=(n,) if l is None else (n, l)) > 0.2
+	return b, cloud_mask, bmol, sel
+
+@pytest.mark.parametrize('l', [None, 3])
+def test_histogram_levels(l):
+	b, _, _, sel = inputs(l)
+	h1 = kernels.histogram_levels(b, sel, HALF, backend='numpy')
+	h2 = kernels.histogram_levels(b, sel, HALF, backend='numba')
+	assert h1.shape == (len(HALF) - 1,) + b.shape[1:]
+	np.testing.assert_array_equal(h1, h2)
+
+@pytest.mark.parametrize('l', [None, 3])
+@pytest.mark.parametrize('with_bmol', [False, True])
+def test_profile_sums(l, with_bmol):
+	b, cloud_mask, bmol, sel = inputs(l)
+	if not with_bmol:
+		bmol = None
+	res1 = kernels.profile_sums(cloud_mask, b, bmol, sel, backend='numpy')
+	res2 = kernels.profile_sums(cloud_mask, b, bmol, sel, backend='numba')
+	for x1, x2 in zip(res1, res2):
+		assert np.shape(x1) == np.shape(x2)
+		np.testing.assert_array_equal(x1, x2)
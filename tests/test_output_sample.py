@@ -0,0 +1,64 @@
+import numpy as np
+from alcf import misc
+from alcf.algorithms import output_sample, tsample
+
+TRES = 60/86400.
+OUTPUT_SAMPLING = 600/86400.
+
+def dataset(dt=60/86400.):
+	"""Dataset of masked backscatter in profiles of length dt in the first
+	half of an output sampling period"""
+	rng = np.random.default_rng(2)
+	n = int(round(300/86400./dt))
+	time = 2459000.5 + (np.arange(n) + 0.5)*dt
+	b = rng.uniform(size=(n, 3))
+	mask = np.zeros(b.shape, bool)
+	mask[1,0] = True
+	mask[3] = True
+	d = {
+		'time': time,
+		'time_bnds': misc.time_bnds(time, dt),
+		# Masked values are stored as the netCDF fill value.
+		'backscatter': np.ma.array(np.where(mask, 9.969209968386869e36, b),
+			mask=mask),
+		'.': {
+			'time': {'.dims': ['time']},
+			'time_bnds': {'.dims': ['time', 'bnds']},
+			'backscatter': {'.dims': ['time', 'level']},
+		},
+	}
+	misc.set_time_ticks(d)
+	return d
+
+def test_output_sample_masked():
+	d = dataset()
+	b = d['backscatter']
+	output_sample.output_sample(d, TRES, OUTPUT_SAMPLING)
+	b2 = d['backscatter']
+	assert b2.shape == (10, 3)
+	assert np.array_equal(b2[:5], b.filled(np.nan), equal_nan=True)
+	assert np.all(np.isnan(b2[5:]))
+
+def test_output_sample_masked_bins():
+	# Output bins overlapping a masked value are NaN.
+	d = dataset(30/86400.)
+	b = d['backscatter']
+	output_sample.output_sample(d, TRES, OUTPUT_SAMPLING)
+	b2 = d['backscatter'][:5]
+	expected = 0.5*(b.filled(np.nan)[0::2] + b.filled(np.nan)[1::2])
+	assert np.allclose(b2, expected, rtol=1e-12, atol=0, equal_nan=True)
+	assert np.sum(np.isnan(b2)) == 4
+
+def test_tsample_output_sample_identity_masked():
+	# Masked values in profiles already in the bins of tres do not leak as
+	# fill values into the output.
+	d = dataset()
+	mask = np.ma.getmaskarray(d['backscatter'])
+	dd = tsample.stream([d, None], {}, tres=TRES)
+	dd = output_sample.stream(dd, {},
+		tres=TRES,
+		output_sampling=OUTPUT_SAMPLING,
+	)
+	b2 = np.concatenate([d['backscatter'] for d in dd if d is not None])
+	assert np.array_equal(np.isnan(b2[:5]), mask)
+	assert np.all(np.isnan(b2[5:]))
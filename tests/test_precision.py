@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import ds_format as ds
+from alcf import misc
+from alcf.cmds import lidar
+
+THRESHOLD = 2e-6
+
+def write_input(dirname):
+	"""Write an input file of the default type with clouds and with whole
+	resampling bins of backscatter next to the cloud detection threshold"""
+	rng = np.random.default_rng(6)
+	n, m = 720, 100
+	dt = 60/86400.
+	time = 2459000.5 + (np.arange(n) + 0.5)*dt
+	z = np.arange(m)*50. + 25.
+	b = np.abs(rng.normal(size=(n, m)))*1e-7 + \
+		(rng.uniform(size=(n, m)) > 0.9)*rng.uniform(1e-6, 1e-4, size=(n, m))
+	b[:,80:] = THRESHOLD*(1. + rng.uniform(-1e-7, 1e-7, size=n)[:,np.newaxis])
+	d = {
+		'time': time,
+		'time_bnds': misc.time_bnds(time, dt),
+		'zfull': np.tile(z, (n, 1)),
+		'backscatter': b,
+		'.': {
+			'time': {
+				'.dims': ['time'],
+				'units': 'days since -4712-01-01 12:00 UTC',
+			},
+			'time_bnds': {'.dims': ['time', 'bnds']},
+			'zfull': {'.dims': ['time', 'level']},
+			'backscatter': {'.dims': ['time', 'level']},
+		},
+	}
+	os.makedirs(dirname)
+	ds.write(os.path.join(dirname, 'input.nc'), d)
+
+def run(input_, output, precision):
+	os.makedirs(output)
+	lidar.run('default', input_, output,
+		tres=300,
+		zres=100,
+		cloud_threshold=THRESHOLD,
+		precision=precision,
+	)
+	return [ds.read(os.path.join(output, x)) for x in sorted(os.listdir(output))]
+
+def test_precision_float32(tmp_path):
+	input_ = str(tmp_path/'input')
+	write_input(input_)
+	dd32 = run(input_, str(tmp_path/'float32'), 'float32')
+	dd64 = run(input_, str(tmp_path/'float64'), 'float64')
+	assert len(dd32) == len(dd64) > 0
+	for d32, d64 in zip(dd32, dd64):
+		assert d32['time'].dtype == d32['time_bnds'].dtype == np.float64
+		assert d32['backscatter'].dtype == np.float32
+		assert np.array_equal(d32['time'], d64['time'])
+		assert np.array_equal(d32['time_bnds'], d64['time_bnds'])
+		# Documented bound: backscatter differs by less than about 1e-7 of
+		# the maximum backscatter.
+		b32 = d32['backscatter'].astype(np.float64)
+		b64 = d64['backscatter']
+		bound = 1e-7*np.nanmax(np.abs(b64))
+		assert np.nanmax(np.abs(b32 - b64)) < bound
+		assert np.array_equal(np.isnan(b32), np.isnan(b64))
+		# The cloud mask can differ only where backscatter is within this
+		# bound from the cloud detection threshold.
+		mask = d32['cloud_mask'] != d64['cloud_mask']
+		assert np.any(mask)
+		assert np.all(np.abs(b64[mask] - THRESHOLD) < bound)
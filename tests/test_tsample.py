@@ -0,0 +1,90 @@
+import numpy as np
+from alcf import misc
+from alcf.algorithms import tsample
+
+TRES = 300/86400.
+
+def dataset(time, b, bsd):
+	d = {
+		'time': time,
+		'time_bnds': misc.time_bnds(time, 60/86400.),
+		'backscatter': b,
+		'backscatter_sd': bsd,
+		'.': {
+			'time': {'.dims': ['time']},
+			'time_bnds': {'.dims': ['time', 'bnds']},
+			'backscatter': {'.dims': ['time', 'level']},
+			'backscatter_sd': {'.dims': ['time', 'level']},
+		},
+	}
+	# Time is binned in ticks as in alcf lidar.
+	misc.set_time_ticks(d)
+	return d
+
+def blocks(masked=True):
+	rng = np.random.default_rng(3)
+	n = 20
+	time = 2459000.5 + (np.arange(n) + 0.5)*60/86400.
+	b = rng.uniform(size=(n, 3))
+	bsd = rng.uniform(size=(n, 3))
+	mask = np.zeros(b.shape, bool)
+	if masked:
+		# Masked values in the middle of a bin, in a bin split between the
+		# blocks and in all profiles of a bin.
+		mask[1,0] = True
+		mask[7,1] = True
+		mask[10:15,2] = True
+	b = np.ma.array(np.where(mask, -1e7, b), mask=mask)
+	bsd = np.ma.array(np.where(mask, -1e7, bsd), mask=mask)
+	return [
+		dataset(time[:8], b[:8], bsd[:8]),
+		dataset(time[8:], b[8:], bsd[8:]),
+	], b, bsd
+
+def run(dd):
+	state = {}
+	return tsample.stream(dd + [None], state, tres=TRES)[:-1]
+
+def expected(b, bsd):
+	"""Average of valid values in bins of 5 profiles"""
+	b2 = []
+	bsd2 = []
+	for k in range(4):
+		x = b[5*k:5*(k + 1)]
+		y = bsd[5*k:5*(k + 1)]
+		valid = ~np.ma.getmaskarray(x)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			b2 += [np.sum(np.ma.filled(x, 0), axis=0)/np.sum(valid, axis=0)]
+			bsd2 += [np.sqrt(np.sum(np.ma.filled(y, 0)**2, axis=0)/
+				np.sum(valid, axis=0)**2)]
+	return np.array(b2), np.array(bsd2)
+
+def test_tsample_masked():
+	dd, b, bsd = blocks()
+	out = run(dd)
+	b2 = np.concatenate([d['backscatter'] for d in out])
+	bsd2 = np.concatenate([d['backscatter_sd'] for d in out])
+	eb, ebsd = expected(b, bsd)
+	assert b2.shape == (4, 3)
+	assert np.allclose(b2, eb, rtol=1e-12, atol=0, equal_nan=True)
+	assert np.allclose(bsd2, ebsd, rtol=1e-12, atol=0, equal_nan=True)
+	assert np.isnan(b2[2,2]) and np.sum(np.isnan(b2)) == 1
+
+def test_tsample_unmasked():
+	dd, b, bsd = blocks(masked=False)
+	out = run(dd)
+	b2 = np.concatenate([d['backscatter'] for d in out])
+	eb, ebsd = expected(b, bsd)
+	assert np.allclose(b2, eb, rtol=1e-12, atol=0)
+
+def test_tsample_identity_masked():
+	# Profiles already in the bins of tres are passed through, with masked
+	# values replaced by NaN as in resampled bins.
+	dd, b, bsd = blocks()
+	out = tsample.stream(dd + [None], {}, tres=60/86400.)[:-1]
+	b2 = np.concatenate([d['backscatter'] for d in out])
+	bsd2 = np.concatenate([d['backscatter_sd'] for d in out])
+	assert not isinstance(b2, np.ma.MaskedArray)
+	assert np.array_equal(np.isnan(b2), np.ma.getmaskarray(b))
+	assert np.array_equal(b2, b.filled(np.nan), equal_nan=True)
+	assert np.array_equal(bsd2, bsd.filled(np.nan), equal_nan=True)